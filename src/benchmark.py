@@ -0,0 +1,294 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import platform
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from pathlib import Path
+from calc_assignment_tools import (
+    _get_vars_dict,
+    square_sum_of_dissatisfaction
+)
+from main import load, save
+from methods import method, solve
+from make_demodata import opt, make_data
+from problem import Problem
+
+# グローバル変数
+# 学生×定員の密な行列を作るアルゴリズム.
+dense = ['MNK', 'HNG', 'JV', 'AUC']
+
+
+def is_dir(string):
+    '''
+    引数がディレクトリであるか判定する関数. get_arguments関数で用いている.
+    '''
+    if not Path(string).is_dir():
+        raise argparse.ArgumentTypeError(f'{string} is not directory.')
+    return string
+
+
+def get_arguments():
+    '''
+    引数処理を行う関数.
+    '''
+    fc = argparse.ArgumentDefaultsHelpFormatter
+    p = argparse.ArgumentParser(
+        formatter_class=fc,
+        description='''
+        デモデータで研究室配属の計算時間とメモリ使用量を計測するスクリプト.
+        '''
+    )
+    p.add_argument(
+        '--output',
+        type=is_dir,
+        default='./',
+        metavar='DIR',
+        help='''
+        計測結果のjsonファイルの出力ディレクトリを指定して下さい.
+        '''
+    )
+    p.add_argument(
+        '--sizes',
+        type=int,
+        nargs='+',
+        default=[20, 200, 2000],
+        metavar='INT',
+        help='''
+        計測する生徒数を指定して下さい.
+        '''
+    )
+    p.add_argument(
+        '--ratio',
+        type=float,
+        default=0.1,
+        metavar='FLOAT',
+        help='''
+        生徒数に対する教員数の比を指定して下さい. 教員数は志望順位の数以上とします.
+        '''
+    )
+    p.add_argument(
+        '--limit',
+        type=int,
+        default=10,
+        metavar='INT',
+        help='''
+        志望順位の数を指定して下さい.
+        '''
+    )
+    p.add_argument(
+        '--opt',
+        type=str,
+        nargs='+',
+        choices=opt,
+        default=opt,
+        help='''
+        デモデータ作製時のオプションを指定して下さい.
+        '''
+    )
+    p.add_argument(
+        '--methods',
+        type=str,
+        nargs='+',
+        choices=method,
+        default=method,
+        help='''
+        計測するアルゴリズムを指定して下さい.
+        '''
+    )
+    p.add_argument(
+        '--dense-limit',
+        type=int,
+        default=1000,
+        metavar='INT',
+        help=f'''
+        {", ".join(dense)}と_get_vars_dictは定員の合計がこの値を超える場合に
+        計測しません.
+        '''
+    )
+    p.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        metavar='INT',
+        help='''
+        デモデータ作製に用いる乱数のシードを指定して下さい.
+        '''
+    )
+    p.add_argument(
+        '--no-memory',
+        action='store_true',
+        help='''
+        ピークメモリの計測を行いません.
+        '''
+    )
+    args = p.parse_args()
+    # 引数の前処理.
+    args.output = Path(args.output)
+
+    return args
+
+
+def measure(func, *args, **kwargs):
+    '''
+    func(*args, **kwargs)の返り値と計算時間[s]を返す関数.
+    '''
+    t = time.perf_counter()
+    ret = func(*args, **kwargs)
+    return ret, time.perf_counter()-t
+
+
+def peak_memory(func, *args, **kwargs):
+    '''
+    func(*args, **kwargs)のピークメモリ[byte]をtracemallocで計測する関数.
+    tracemallocは計算時間を大きく伸ばすため, 計算時間とは別に計測する.
+    '''
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def load_problem(path):
+    '''
+    main.pyのrun関数と同じく, 入力ファイルpathを読み込みProblemに変換する関数.
+    '''
+    return Problem.from_data(load(path))
+
+
+def bench_instance(path, methods, dense_limit=1000, memory=True):
+    '''
+    入力ファイルpathについて, 各アルゴリズムの段階ごとの計算時間[s]と
+    ピークメモリ[byte]を計測し, dictのlistで返す関数.
+    '''
+    problem, t_load = measure(load_problem, path)
+    seats = sum(problem.capacity)
+    t_vars = None
+    if seats <= dense_limit:
+        _, t_vars = measure(_get_vars_dict, problem)
+    results = []
+    for name in methods:
+        result = {
+            'method': name,
+            'load': t_load,
+            'vars': t_vars,
+            'solve': None,
+            'score': None,
+            'save': None,
+            'peak_memory': None,
+            'unassigned': None,
+            'ssd': None,
+            'skipped': False
+        }
+        if name in dense and seats > dense_limit:
+            result['skipped'] = True
+            results.append(result)
+            continue
+        assignment, result['solve'] = measure(solve, problem, name)
+        result['unassigned'] = len(assignment.get('未配属', []))
+        if result['unassigned'] == 0:
+            result['ssd'], result['score'] = measure(
+                square_sum_of_dissatisfaction, assignment, problem
+            )
+        with tempfile.TemporaryDirectory() as tmp:
+            # saveの標準出力は計測結果に不要なので捨てる.
+            with contextlib.redirect_stdout(io.StringIO()):
+                _, result['save'] = measure(
+                    save, assignment, Path(tmp), 'assignment.json'
+                )
+        if memory:
+            result['peak_memory'] = peak_memory(solve, problem, name)
+        results.append(result)
+    return results
+
+
+def benchmark(
+    sizes, options, methods, ratio=0.1, limit=10, dense_limit=1000,
+    seed=0, memory=True
+):
+    '''
+    生徒数sizesのデモデータを作製し, 各アルゴリズムを計測する関数.
+    計測結果をmain.pyの出力と同じくjsonに書き出せるdictで返す.
+    '''
+    report = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'seed': seed,
+        'results': []
+    }
+    for ns in sizes:
+        nt = max(limit, math.ceil(ns*ratio))
+        for option in options:
+            data, t_make = measure(
+                make_data, ns, nt, limit=limit, option=option, seed=seed
+            )
+            with tempfile.TemporaryDirectory() as tmp:
+                path = Path(tmp)/f'demodata_{option}.json'
+                with path.open('w') as f:
+                    text = json.dumps(
+                        data, sort_keys=True, ensure_ascii=False, indent=2
+                    )
+                    f.write(text)
+                results = bench_instance(
+                    path, methods, dense_limit=dense_limit, memory=memory
+                )
+            for result in results:
+                report['results'].append({
+                    'ns': ns,
+                    'nt': nt,
+                    'limit': limit,
+                    'opt': option,
+                    'make': t_make,
+                    **result
+                })
+                print_result(report['results'][-1])
+    return report
+
+
+def print_result(result):
+    '''
+    1件の計測結果を標準出力する関数.
+    '''
+    if result['skipped']:
+        print(
+            f'{result["ns"]:>7} {result["opt"]:<8} {result["method"]:<6} '
+            'skipped'
+        )
+        return
+    phases = ' '.join(
+        f'{k}={result[k]:.3f}s'
+        for k in ['load', 'vars', 'solve', 'score', 'save']
+        if result[k] is not None
+    )
+    msg = f'{result["ns"]:>7} {result["opt"]:<8} {result["method"]:<6} {phases}'
+    if result['peak_memory'] is not None:
+        msg += f' peak={result["peak_memory"]/2**20:.1f}MiB'
+    print(msg)
+
+
+if __name__ == '__main__':
+    args = get_arguments()
+    report = benchmark(
+        args.sizes, args.opt, args.methods,
+        ratio=args.ratio, limit=args.limit, dense_limit=args.dense_limit,
+        seed=args.seed, memory=not args.no_memory
+    )
+    # 計測結果を出力
+    name = 'benchmark.json'
+    name_list = [p.name for p in args.output.glob('*')]
+    i = 1
+    while name in name_list:
+        name = f'benchmark({i}).json'
+        i += 1
+    with (args.output/name).open(mode='w') as f:
+        text = json.dumps(report, sort_keys=True, ensure_ascii=False, indent=2)
+        f.write(text)
+    print(f'{(args.output/name).resolve()} saved.')
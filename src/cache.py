@@ -0,0 +1,163 @@
+import hashlib
+import os
+import numpy as np
+from collections import OrderedDict
+from pathlib import Path
+
+# グローバル変数
+# キャッシュの形式を変えた場合は値を上げ, 古いキャッシュを使わないようにする.
+version = 1
+
+
+class Cache:
+    '''
+    Problemの内容と計算の引数から求めたハッシュ値をキーとして,
+    行列や配属結果 (配列のdict) を保存するキャッシュ.
+    直近に使ったものをメモリに保持し, directoryを指定した場合は
+    ディレクトリに.npzファイルとしても保存する.
+    ディレクトリの合計がmax_bytesを超えた場合, 最後に使った時刻
+    (ファイルの更新時刻) が古いものから削除する.
+    '''
+
+    def __init__(self, directory=None, max_bytes=2**30, memory=4):
+        self.directory = None if directory is None else Path(directory)
+        self.max_bytes = max_bytes
+        self.memory = memory
+        self.entries = OrderedDict()
+        # 直前にハッシュ値を求めたProblemとそのハッシュ値.
+        self._digest = (None, None)
+
+    def digest(self, problem):
+        '''
+        Problemの内容のハッシュ値を返す関数.
+        学生と教員の並び順も含めて同じ場合だけ一致する.
+        '''
+        if self._digest[0] is problem:
+            return self._digest[1]
+        h = hashlib.sha256(f'version={version}'.encode())
+        for names in [problem.students, problem.teachers]:
+            text = '\n'.join(names).encode()
+            h.update(len(text).to_bytes(8, 'little'))
+            h.update(text)
+        for array in [
+            problem.capacity,
+            problem.choice_ptr, problem.choice_teacher, problem.choice_rank,
+            problem.pref_ptr, problem.pref_student, problem.pref_rank
+        ]:
+            data = np.asarray(array, np.int64).tobytes()
+            h.update(len(data).to_bytes(8, 'little'))
+            h.update(data)
+        # 部分問題は元のProblemの順位で費用を計算するため, その値も含める.
+        if problem.ranks is not None:
+            h.update(repr(problem.ranks).encode())
+        self._digest = (problem, h.hexdigest())
+        return self._digest[1]
+
+    def key(self, problem, *params):
+        '''
+        Problemと計算の引数paramsからキーを求める関数.
+        '''
+        h = hashlib.sha256(self.digest(problem).encode())
+        h.update(repr(params).encode())
+        return h.hexdigest()
+
+    def get(self, key):
+        '''
+        キーkeyの配列のdictを返す関数. 保存されていない場合はNoneを返す.
+        '''
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        if self.directory is None:
+            return None
+        path = self.directory/f'{key}.npz'
+        try:
+            with np.load(path) as f:
+                arrays = {k: f[k] for k in f.files}
+            os.utime(path)
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        self._remember(key, arrays)
+        return arrays
+
+    def put(self, key, arrays):
+        '''
+        キーkeyで配列のdict arraysを保存する関数.
+        '''
+        self._remember(key, arrays)
+        if self.directory is None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory/f'{key}.npz'
+        # 他のプロセスが読み込み途中のファイルを壊さないように, 一時ファイルから置き換える.
+        tmp = self.directory/f'{key}.{os.getpid()}.tmp'
+        with tmp.open('wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        '''
+        ディレクトリの合計がmax_bytes以下になるまで, 古いものから削除する関数.
+        '''
+        entries = []
+        for path in self.directory.glob('*.npz'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(e[1] for e in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _remember(self, key, arrays):
+        self.entries[key] = arrays
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.memory:
+            self.entries.popitem(last=False)
+
+
+def encode_assignment(assignment, problem):
+    '''
+    配属assignmentを, 教員ごとの学生の並び順を保った配列のdictに変換する関数.
+    studentには学生番号を配属結果の順に並べ, teacherには配属先の教員番号
+    (未配属の学生は-1) を並べる.
+    '''
+    sindex = {s: i for i, s in enumerate(problem.students)}
+    student, teacher = [], []
+    for j, t in enumerate(problem.teachers):
+        for s in assignment.get(t, []):
+            student.append(sindex[s])
+            teacher.append(j)
+    for s in assignment.get('未配属', []):
+        student.append(sindex[s])
+        teacher.append(-1)
+    return {
+        'student': np.array(student, np.int64),
+        'teacher': np.array(teacher, np.int64),
+    }
+
+
+def decode_assignment(arrays, problem):
+    '''
+    encode_assignment関数で変換した配列のdictを配属に戻す関数.
+    '''
+    S, T = problem.students, problem.teachers
+    assignment = {t: [] for t in T}
+    unassigned = []
+    for i, j in zip(arrays['student'].tolist(), arrays['teacher'].tolist()):
+        if j >= 0:
+            assignment[T[j]].append(S[i])
+        else:
+            unassigned.append(S[i])
+
+    if len(unassigned) != 0:
+        assignment['未配属'] = unassigned
+    return assignment
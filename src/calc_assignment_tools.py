@@ -1,97 +1,406 @@
+import os
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from munkres import Munkres
 from pprint import pprint
+from da import (
+    DA,
+    _da_assignment,
+    _da_restore,
+    _da_resume,
+    _da_snapshot,
+    _da_state,
+    _deferred_acceptance
+)
+from instrument import (
+    Profiler,
+    add_hook,
+    remove_hook,
+    emit,
+    enabled,
+    phase,
+    record_array
+)
+from problem import Problem, as_problem
+from rank_maximal import RMX, RankMaximal
 
+# グローバル変数
+# set_cache関数で設定したキャッシュ (cache.pyのCache).
+_cache = None
+# Auctionクラスの入札の方法.
+auction = ['gauss-seidel', 'jacobi']
 
-def DA(data):
+
+def set_cache(cache):
     '''
-    deferred acceptance algorithmにより配属を決定する関数.
-    配属が決まらなかった学生はassignment['未配属']に格納される.
+    W, Aの行列を保存するキャッシュ (cache.pyのCache) を設定する関数.
+    Noneを指定するとキャッシュを使わない.
     '''
-    assignment = {t: [] for t in list(data['teachers'].keys())}
-    unassigned = list(data['students'].keys())
-    limit = len(data['students'][list(data['students'].keys())[0]]['choice'])
-    # 第1志望から順に未配属の学生を配属していく.
-    for i in range(1, limit+1):
-        for s in unassigned:
-            choice = data['students'][s]['choice'].items()
-            for t, j in choice:
-                if i == j:
-                    break
-            assignment[t].append(s)
-        # 教員の選好順位を元に配属者数を定員に収める.
-        unassigned = []
-        for t in data['teachers'].keys():
-            c = data['teachers'][t]['capacity']
-            if len(assignment[t]) > c:
-                applicants = sorted(
-                    [
-                        (s, data['teachers'][t]['preference'][s])
-                        for s in assignment[t]
-                    ],
-                    key=lambda x: x[1]
-                )
-                assignment[t] = [x[0] for x in applicants[:c]]
-                # 定員からあぶれた生徒はunassignedに格納される.
-                unassigned += [x[0] for x in applicants[c:]]
+    global _cache
+    _cache = cache
 
-    if len(unassigned) != 0:
-        assignment['未配属'] = unassigned
 
-    return assignment
+def get_cache():
+    '''
+    set_cache関数で設定したキャッシュを返す関数.
+    '''
+    return _cache
 
 
 def MNK(data):
     '''
     munkresモジュールを用いて割当問題の最適解を1つだけ導く関数.
     '''
-    assignment = {t: [] for t in data['teachers'].keys()}
-    vars_dict = _get_vars_dict(data)
+    problem = as_problem(data)
+    assignment = {t: [] for t in problem.teachers}
+    vars_dict = _get_vars_dict(problem)
     M = (100.-vars_dict['W']*vars_dict['A'])**2
-    sol = Munkres().compute(M)
+    record_array('M', M)
+    with phase('Munkres.compute'):
+        sol = Munkres().compute(M)
     for i, j in sol:
         s = vars_dict['S'][i]
         t = vars_dict['U'][j]
         assignment[t].append(s)
 
-    _breakup(assignment, data)
+    _breakup(assignment, problem)
     return assignment
 
 
-def HNG(data):
+def HNG(data, solver='JV'):
     '''
-    ハンガリー法を用いて割当問題の最適解を全て導く関数.
-    ハンガリー法はhungarian関数で実装されている.
+    ハンガリー法を用いて割当問題の最適解を導く関数.
+    solver='JV'ではoptimal_assignments関数が最初に生成する最適解を返し,
+    solver='step'ではHungarianクラスにより最適解を全て導いてその1つを返す.
     '''
+    problem = as_problem(data)
+    if solver == 'JV':
+        return next(optimal_assignments(problem, max_solutions=1))
     assignments = []
-    vars_dict = _get_vars_dict(data)
+    vars_dict = _get_vars_dict(problem)
     M = (100.-vars_dict['W']*vars_dict['A'])**2
-    sols = Hungarian(M).compute()
+    record_array('M', M)
+    if solver == 'step':
+        sols = Hungarian(M).compute()
+    else:
+        raise RuntimeError(f'Unknown solver: {solver}.')
     for sol in sols:
-        assignment = {t: [] for t in data['teachers'].keys()}
+        assignment = {t: [] for t in problem.teachers}
         for i, j in sol:
             s = vars_dict['S'][i]
             t = vars_dict['U'][j]
             assignment[t].append(s)
 
-        _breakup(assignment, data)
+        _breakup(assignment, problem)
         if not _overlapping(assignment, assignments):
             assignments.append(assignment)
 
     return assignments[0]
 
 
-def square_sum_of_dissatisfaction(assignment, data):
+def JV(data):
+    '''
+    LAPJVクラスを用いて割当問題の最適解を1つだけ導く関数.
+    '''
+    problem = as_problem(data)
+    assignment = {t: [] for t in problem.teachers}
+    vars_dict = _get_vars_dict(problem)
+    M = (100.-vars_dict['W']*vars_dict['A'])**2
+    record_array('M', M)
+    sol = LAPJV(M).compute()
+    for i, j in sol:
+        s = vars_dict['S'][i]
+        t = vars_dict['U'][j]
+        assignment[t].append(s)
+
+    _breakup(assignment, problem)
+    return assignment
+
+
+def AUC(data, variant=auction[0], eps=1e-6, jobs=None):
+    '''
+    オークション法 (Auctionクラス) を用いて割当問題の最適解を1つだけ導く関数.
+    不満の自乗の和は, MNKの最適解と学生数×eps以内で一致する.
+    variantには入札の方法を, jobsにはjacobiで入札を計算するスレッド数を指定する.
+    '''
+    problem = as_problem(data)
+    assignment = {t: [] for t in problem.teachers}
+    vars_dict = _get_vars_dict(problem)
+    M = (100.-vars_dict['W']*vars_dict['A'])**2
+    record_array('M', M)
+    sol = Auction(M, eps=eps, variant=variant, jobs=jobs).compute()
+    for i, j in sol:
+        s = vars_dict['S'][i]
+        t = vars_dict['U'][j]
+        assignment[t].append(s)
+
+    _breakup(assignment, problem)
+    return assignment
+
+
+def MCF(data):
+    '''
+    教員を定員枠に展開せず, 学生×教員の費用行列の輸送問題 (最小費用流) として
+    割当問題の最適解を1つだけ導く関数.
+    定員の合計が学生数より少ない場合, 割り当てられなかった学生は
+    assignment['未配属']に格納される.
+    '''
+    problem = as_problem(data)
+    col4row = _transport(_get_cost_matrix(problem), problem.capacity)
+    return _to_assignment(col4row, problem)
+
+
+def SPR(data, penalty=None, unchoice=20):
+    '''
+    志望リストに含まれる (学生, 教員) の組だけを持つ疎な費用行列から始めて,
+    割当問題の最適解を1つだけ導く関数.
+    各学生に費用penaltyの予備の列を加えてSparseTransportationクラスで解き,
+    双対変数u, vについて被約費用 (不満の自乗-u_s-v_t) が負となる組があれば,
+    その組を加えて解き直す. 負の組が無くなれば, 全ての組の費用行列に対しても
+    最適解であり, 不満の自乗の和はMCFの最適解と一致する.
+    penaltyは不満の自乗の最大値100^2より大きくなければならない (既定値は100^2+1).
+    予備の列に割り当てた学生はassignment['未配属']に格納される.
+    メモリ使用量は学生数×教員数ではなく, 志望の総数と加えた組の数に比例する.
+    '''
+    problem = as_problem(data)
+    ns, nt = problem.ns, problem.nt
+    if penalty is None:
+        penalty = 100.**2+1.
+    rows = np.repeat(np.arange(ns), np.diff(problem.choice_ptr))
+    cols = np.asarray(problem.choice_teacher, int)
+    with phase('_pair_cost'):
+        cost = _pair_cost(problem, rows, cols, unchoice=unchoice)
+    record_array('cost', cost)
+    bound = _unlisted_bound(problem, unchoice=unchoice)
+    capacity = np.append(np.asarray(problem.capacity, int), ns)
+    tol = 1e-9*penalty
+    while True:
+        # 組を学生ごとに並べ, 各学生の末尾に予備の列ntを加える.
+        order = np.argsort(rows, kind='stable')
+        rows, cols, cost = rows[order], cols[order], cost[order]
+        ptr = np.append(0, np.cumsum(np.bincount(rows, minlength=ns)))
+        solver = SparseTransportation(
+            ptr+np.arange(ns+1),
+            np.insert(cols, ptr[1:], nt),
+            np.insert(cost, ptr[1:], penalty),
+            capacity
+        )
+        col4row = solver.solve()
+        with phase('_negative_pairs'):
+            new_rows, new_cols, new_cost = _negative_pairs(
+                problem, solver.u, solver.v[:nt], bound, tol,
+                unchoice=unchoice
+            )
+        if enabled():
+            emit('sparse_pricing', pairs=len(cols), negative=len(new_cols))
+        if len(new_cols) == 0:
+            break
+        rows = np.concatenate([rows, new_rows])
+        cols = np.concatenate([cols, new_cols])
+        cost = np.concatenate([cost, new_cost])
+    col4row[col4row == nt] = -1
+    return _to_assignment(col4row, problem)
+
+
+def _unlisted_bound(problem, unchoice=20):
+    '''
+    学生が志望していない教員tに配属したときの不満の自乗の下限を, 教員ごとに並べた
+    配列を返す関数. 教員tの最も高い選好順位と志望していない場合の志望順位unchoiceから求める.
+    '''
+    nt = problem.nt
+    wlimit, alimit = _ilimits(problem, unchoice)
+    best = np.full(nt, max(alimit), float)
+    tcols = np.repeat(np.arange(nt), np.diff(problem.pref_ptr))
+    np.minimum.at(best, tcols, np.asarray(problem.pref_rank, float))
+    W = _calc_w(np.full(nt, unchoice, float), wlimit, [100., 50.])
+    A = _calc_a(best, alimit, [1., 0.])
+    return (100.-W*A)**2
+
+
+def _negative_pairs(problem, u, v, bound, tol, unchoice=20, size=2**20):
+    '''
+    双対変数u, vについて, 被約費用が-tolより小さい (学生, 教員) の組の
+    学生番号, 教員番号, 不満の自乗の配列を返す関数.
+    教員ごとの下限boundで被約費用が負になり得る学生を絞り,
+    その学生だけsize個程度の元ずつ全ての教員との費用を計算する.
+    既に加えた組の被約費用は負にならないため, 返す組は全て新しい組である.
+    '''
+    ns, nt = problem.ns, problem.nt
+    rows = np.flatnonzero(u > (bound-v).min(initial=np.inf)+tol)
+    found = [(np.empty(0, int), np.empty(0, int), np.empty(0, float))]
+    step = max(1, size//max(nt, 1))
+    for k in range(0, len(rows), step):
+        r = rows[k:k+step]
+        R = np.repeat(r, nt)
+        C = np.tile(np.arange(nt), len(r))
+        cost = _pair_cost(problem, R, C, unchoice=unchoice)
+        hit = cost-u[R]-v[C] < -tol
+        found.append((R[hit], C[hit], cost[hit]))
+    return tuple(np.concatenate(x) for x in zip(*found))
+
+
+def _transport(M, capacity):
     '''
-    不満の最小自乗和を計算する関数
+    費用行列Mと列の定員capacityの輸送問題を解き, 各行の列番号の配列を返す関数.
+    定員の合計が行数より少ない場合, 割り当てられなかった行の値は-1である.
     '''
-    vars_dict = _get_vars_dict(data)
-    _sum = 0.
-    for i, s in enumerate(vars_dict['S']):
-        for j, t in enumerate(vars_dict['U']):
-            x = 1 if s in assignment[t] else 0
-            _sum += x*(100.-vars_dict['W'][i, j]*vars_dict['A'][i, j])**2
-    return _sum
+    n, m = M.shape
+    capacity = list(capacity)
+    # 定員が足りない場合は, 十分大きな費用を持つ未配属の列を加える.
+    overflow = max(0, n-sum(capacity))
+    if overflow != 0:
+        big = np.full((n, 1), M.max(initial=0.)*n+1.)
+        M = np.hstack([M, big])
+        capacity.append(overflow)
+    col4row = Transportation(M, capacity).solve()
+    col4row[col4row >= m] = -1
+    return col4row
+
+
+def _to_assignment(col4row, problem):
+    '''
+    各学生の教員番号の配列col4rowを配属のdictに変換する関数.
+    値が-1の学生はassignment['未配属']に格納される.
+    '''
+    S, T = problem.students, problem.teachers
+    assignment = {t: [] for t in T}
+    unassigned = []
+    for i, j in enumerate(col4row):
+        if j >= 0:
+            assignment[T[j]].append(S[i])
+        else:
+            unassigned.append(S[i])
+
+    if len(unassigned) != 0:
+        assignment['未配属'] = unassigned
+    return assignment
+
+
+def optimal_assignments(data, max_solutions=None):
+    '''
+    割当問題の最適解を1つずつ生成するジェネレータ.
+    同じ教員の定員枠を入れ替えただけの解は生成しないため, 生成される配属は全て異なる.
+    max_solutionsで生成する解の数の上限を指定出来る.
+    '''
+    problem = as_problem(data)
+    vars_dict = _get_vars_dict(problem)
+    M = (100.-vars_dict['W']*vars_dict['A'])**2
+    record_array('M', M)
+    sols = enumerate_assignments(
+        M, groups=vars_dict['U'], max_solutions=max_solutions
+    )
+    for sol in sols:
+        assignment = {t: [] for t in problem.teachers}
+        for i, j in sol:
+            s = vars_dict['S'][i]
+            t = vars_dict['U'][j]
+            assignment[t].append(s)
+
+        _breakup(assignment, problem)
+        yield assignment
+
+
+def square_sum_of_dissatisfaction(assignment, data, cost=None):
+    '''
+    不満の最小自乗和を計算する関数.
+    costには_get_cost_matrix関数で計算した学生×教員の費用行列を指定出来る.
+    未配属の学生は和に含めない.
+    '''
+    return float(
+        square_sums_of_dissatisfaction([assignment], data, cost=cost)[0]
+    )
+
+
+def square_sums_of_dissatisfaction(assignments, data, cost=None):
+    '''
+    複数の配属assignmentsの不満の最小自乗和をまとめて計算し, 配列で返す関数.
+    各配属を学生ごとの教員番号の配列に変換し, 費用行列から1度に値を取り出す.
+    '''
+    problem = as_problem(data)
+    S, T = problem.students, problem.teachers
+    if cost is None:
+        cost = _get_cost_matrix(problem)
+    index = np.stack(
+        [_assignment_index(a, S, T) for a in assignments]
+    ).reshape(-1, len(S))
+    assigned = index >= 0
+    values = cost[np.arange(len(S))[None, :], np.where(assigned, index, 0)]
+    return np.where(assigned, values, 0.).sum(axis=1)
+
+
+def _get_cost_matrix(data):
+    '''
+    学生sを教員tに配属したときの不満の自乗 (100-W_st*A_st)^2 を元に持つ
+    学生×教員の費用行列を計算して返す関数.
+    '''
+    problem = as_problem(data)
+    with phase('_get_cost_matrix'):
+        W, A = _get_WA(problem)
+        cost = (100.-W*A)**2
+    record_array('cost', cost)
+    return cost
+
+
+def _pair_cost(problem, rows, cols, unchoice=20):
+    '''
+    学生rows[k]を教員cols[k]に配属したときの不満の自乗を並べた配列を返す関数.
+    _get_cost_matrix関数の元のうち必要なものだけを, 志望順位と選好順位の
+    二分探索で計算する.
+    '''
+    ns, nt = problem.ns, problem.nt
+    rows, cols = np.asarray(rows, np.int64), np.asarray(cols, np.int64)
+    # 志望順位. 志望していない教員の志望順位はunchoiceとする.
+    crank = np.asarray(problem.choice_rank)
+    if crank.size != 0 and crank.max() >= unchoice:
+        msg = 'Value of argument unchoice must be greater than max choice ranking number.'
+        raise RuntimeError(msg)
+    crow = np.repeat(np.arange(ns, dtype=np.int64), np.diff(problem.choice_ptr))
+    ckey = crow*nt+np.asarray(problem.choice_teacher)
+    order = np.argsort(ckey, kind='stable')
+    K = _lookup(ckey[order], crank[order], rows*nt+cols, unchoice)
+    # 選好順位. 選好順位の無い学生は最下位とする.
+    # 選好は教員ごとに学生番号の昇順に並んでいるため, 教員ごとに二分探索する.
+    prank = np.asarray(problem.pref_rank)
+    pstudent = np.asarray(problem.pref_student)
+    pptr = np.asarray(problem.pref_ptr)
+    wlimit, alimit = _ilimits(problem, unchoice)
+    worst = max(alimit)
+    P = np.empty(len(rows), float)
+    order = np.argsort(cols, kind='stable')
+    bounds = np.searchsorted(cols[order], np.arange(nt+1))
+    for j in range(nt):
+        q = order[bounds[j]:bounds[j+1]]
+        if len(q) != 0:
+            a, b = pptr[j], pptr[j+1]
+            P[q] = _lookup(pstudent[a:b], prank[a:b], rows[q], worst)
+    # _calc_W, _calc_A関数の既定のlimitと同じ対応で度合いに変換する.
+    W = _calc_w(K, wlimit, [100., 50.])
+    A = _calc_a(P, alimit, [1., 0.])
+    return (100.-W*A)**2
+
+
+def _lookup(keys, values, query, default):
+    '''
+    昇順に並んだkeysからqueryを二分探索し, 対応するvaluesの値を返す関数.
+    見つからない場合はdefaultを返す.
+    '''
+    if len(keys) == 0:
+        return np.full(len(query), default, float)
+    pos = np.minimum(np.searchsorted(keys, query), len(keys)-1)
+    found = keys[pos] == query
+    return np.where(found, values[pos], default).astype(float)
+
+
+def _assignment_index(assignment, S, T):
+    '''
+    配属assignmentを, 学生ごとに配属先の教員番号を持つ配列に変換する関数.
+    未配属の学生の値は-1である.
+    '''
+    sindex = {s: i for i, s in enumerate(S)}
+    index = np.full(len(S), -1, int)
+    for j, t in enumerate(T):
+        index[[sindex[s] for s in assignment.get(t, [])]] = j
+    return index
 
 
 def _overlapping(assignment, assignments):
@@ -114,9 +423,11 @@ def _breakup(assignment, data):
     '''
     教員に配属された学生数が定員を超えている場合, その学生を未配属にする関数.
     '''
+    problem = as_problem(data)
+    capacity = dict(zip(problem.teachers, problem.capacity))
     unassigned = []
     for t, slist in assignment.items():
-        if len(slist) > data['teachers'][t]['capacity']:
+        if len(slist) > capacity[t]:
             unassigned += slist
             assignment[t] = []
 
@@ -128,32 +439,70 @@ def _get_vars_dict(data):
     '''
     dataを計算しやすい形式に変換する関数.
     '''
+    problem = as_problem(data)
+    cols = [j for j, c in enumerate(problem.capacity) for _ in range(c)]
     vars_dict = {}
-    vars_dict['S'] = list(data['students'].keys())
-    vars_dict['T'] = list(data['teachers'].keys())
-    vars_dict['U'] = sum(
-        [
-            [t for _ in range(data['teachers'][t]['capacity'])]
-            for t in data['teachers'].keys()
-        ],
-        []
-    )
-    vars_dict['W'] = _calc_W(data, vars_dict['S'], vars_dict['U'])
-    vars_dict['A'] = _calc_A(data, vars_dict['S'], vars_dict['U'])
+    vars_dict['S'] = problem.students
+    vars_dict['T'] = problem.teachers
+    vars_dict['U'] = [problem.teachers[j] for j in cols]
+    with phase('_get_vars_dict'):
+        W, A = _get_WA(problem)
+        vars_dict['W'] = W[:, cols]
+        vars_dict['A'] = A[:, cols]
+    record_array('W', vars_dict['W'])
+    record_array('A', vars_dict['A'])
     return vars_dict
 
 
-def _calc_W(data, S, T, limit=None, unchoice=20):
+def _get_WA(problem, limit=None, unchoice=20):
+    '''
+    学生×教員の行列W, Aを返す関数.
+    キャッシュが設定されている場合, 同じProblemと引数で計算したW, Aを再利用する.
+    limitはWの元の上限と下限を定めるリストである.
+    '''
+    if _cache is None:
+        return (
+            _calc_W(problem, limit=limit, unchoice=unchoice),
+            _calc_A(problem)
+        )
+    key = _cache.key(problem, 'WA', limit, unchoice)
+    arrays = _cache.get(key)
+    if arrays is None:
+        arrays = {
+            'W': _calc_W(problem, limit=limit, unchoice=unchoice),
+            'A': _calc_A(problem)
+        }
+        _cache.put(key, arrays)
+    return arrays['W'], arrays['A']
+
+
+def _ilimits(problem, unchoice=20):
+    '''
+    _calc_w関数に渡す志望順位の上限と下限のリストと, _calc_a関数に渡す
+    選好順位の上限と下限のリストを返す関数.
+    Problem.subproblem関数で作った部分問題では, 元のProblemの順位から求めるため,
+    費用は元のProblemと同じになる.
+    '''
+    cmin, pmin, pmax = problem.rank_limits()
+    # 選好順位が1つも無い場合は, 全ての学生を同じ順位とみなす.
+    worst = 0 if pmax is None else pmax
+    return (
+        [unchoice if cmin is None else cmin, unchoice],
+        [worst if pmin is None else pmin, worst]
+    )
+
+
+def _calc_W(problem, limit=None, unchoice=20):
     '''
     学生sが教員tを志望する度合いW_stを元に持つ行列Wを計算して返す関数.
     limitはWの元の上限と下限を定めるリストである.
     '''
     _limit = [100., 50.]
-    li = list(data['students'][S[0]]['choice'].values())
-    if max(li) >= unchoice:
+    li = np.asarray(problem.choice_rank)
+    if li.size != 0 and li.max() >= unchoice:
         msg = 'Value of argument unchoice must be greater than max choice ranking number.'
         raise RuntimeError(msg)
-    ilimit = [min(li), unchoice]
+    ilimit = _ilimits(problem, unchoice)[0]
     msg = 'Argument limit must be list of which length is 2.'
     if limit is None:
         limit = _limit
@@ -162,35 +511,34 @@ def _calc_W(data, S, T, limit=None, unchoice=20):
     elif len(limit) != 2:
         raise RuntimeError(msg)
     olimit = limit
-    W = np.zeros((len(S), len(T)), float)
-    for i, s in enumerate(S):
-        for j, t in enumerate(T):
-            if t in data['students'][s]['choice'].keys():
-                k = int(data['students'][s]['choice'][t])
-            else:
-                k = unchoice
-            W[i, j] = _calc_w(k, ilimit, olimit)
-    return W
+    # 学生ごと, 教員ごとの志望順位の行列Kを作る.
+    K = np.full((problem.ns, problem.nt), unchoice, float)
+    rows = np.repeat(np.arange(problem.ns), np.diff(problem.choice_ptr))
+    K[rows, np.asarray(problem.choice_teacher)] = li
+    return _calc_w(K, ilimit, olimit)
 
 
 def _calc_w(_in, ilimit, olimit):
     '''
     志望順位_inからW_stを計算する関数.
-    W_stは志望順位の単調減少関数.
+    W_stは志望順位の単調減少関数. _inには配列も指定出来る.
     '''
+    # 志望が1つも無い場合は, 全て志望していない教員とみなしolimitの下限とする.
+    if min(ilimit) == max(ilimit):
+        return np.full_like(_in, min(olimit), dtype=float)
     srope = (max(olimit)-min(olimit))/(min(ilimit)-max(ilimit))
     intercept = max(olimit)-srope*min(ilimit)
     return srope*_in+intercept
 
 
-def _calc_A(data, S, T, limit=None):
+def _calc_A(problem, limit=None):
     '''
     教員tが学生sを選好する度合いA_stを元に持つ行列Aを計算して返す関数.
     limitはAの元の上限と下限を定めるリストである.
     '''
     _limit = [1., 0.]
-    li = list(data['teachers'][T[0]]['preference'].values())
-    ilimit = [min(li), max(li)]
+    li = np.asarray(problem.pref_rank)
+    ilimit = _ilimits(problem)[1]
     msg = 'Argument limit must be list of which length is 2.'
     if limit is None:
         limit = _limit
@@ -199,24 +547,139 @@ def _calc_A(data, S, T, limit=None):
     elif len(limit) != 2:
         raise RuntimeError(msg)
     olimit = limit
-    A = np.zeros((len(S), len(T)), float)
-    for i, s in enumerate(S):
-        for j, t in enumerate(T):
-            k = data['teachers'][t]['preference'][s]
-            A[i, j] = _calc_a(k, ilimit, olimit)
-    return A
+    # 学生ごと, 教員ごとの選好順位の行列Kを作る.
+    # 選好順位の無い学生は最下位とみなす.
+    K = np.full((problem.ns, problem.nt), max(ilimit), float)
+    tcols = np.repeat(np.arange(problem.nt), np.diff(problem.pref_ptr))
+    K[np.asarray(problem.pref_student), tcols] = li
+    return _calc_a(K, ilimit, olimit)
 
 
 def _calc_a(_in, ilimit, olimit):
     '''
     選好順位_inからA_stを計算する関数.
-    A_stは選好順位の単調減少関数.
+    A_stは選好順位の単調減少関数. _inには配列も指定出来る.
     '''
+    # 選好順位が全て同じ場合は, 全ての学生をolimitの上限とする.
+    if min(ilimit) == max(ilimit):
+        return np.full_like(_in, max(olimit), dtype=float)
     srope = (max(olimit)-min(olimit))/(min(ilimit)-max(ilimit))
     intercept = max(olimit)-srope*min(ilimit)
     return srope*_in+intercept
 
 
+def enumerate_assignments(matrix, groups=None, max_solutions=None):
+    '''
+    割当問題の最適解を (行番号, 列番号) のリストとして1つずつ生成するジェネレータ.
+    LAPJVで求めた最適なポテンシャルに対して被約費用が0となる辺
+    (等式部分グラフ) だけを深さ優先探索で辿るため, メモリ使用量は行数に比例する.
+    groupsは各列のラベルのリストで, 同じラベルの列は同一の定員枠とみなし,
+    枠の入れ替えだけが異なる解は1つにまとめる.
+    行数が列数より多い場合, 割当の無い行は解に含まれない.
+    '''
+    C = np.array(matrix, float)
+    n, m = C.shape
+    if groups is None:
+        groups = list(range(m))
+    # 列をラベルごとにまとめる. 正方行列にするために加えた列は1つの枠とみなす.
+    gindex = {}
+    gid = [gindex.setdefault(g, len(gindex)) for g in groups]
+    N = max(n, m)
+    gid += [len(gindex)]*(N-m)
+    gid = np.array(gid, int)
+    ngroup = int(gid.max())+1 if N != 0 else 0
+    # 正方行列にして最適なポテンシャルを求める. 加えた行と列の費用は0である.
+    P = np.zeros((N, N), float)
+    P[:n, :m] = C
+    lap = LAPJV(P)
+    lap.compute()
+    u, v = lap.u, lap.v
+    optimum = P[np.arange(n), lap.col4row[:n]].sum()
+    tol = 1e-9*max(1., float(np.abs(P).max(initial=0.)))*max(N, 1)
+    # 同じ枠の列のポテンシャルは等しいため, 枠ごとに被約費用を調べる.
+    first = np.zeros(ngroup, int)
+    first[gid[::-1]] = np.arange(N)[::-1]
+    red = P[:n, first]-u[:n, None]-v[None, first]
+    cands = [np.flatnonzero(red[i] <= tol).tolist() for i in range(n)]
+    if enabled():
+        emit(
+            'equality_subgraph', rows=n, groups=ngroup,
+            edges=sum(len(c) for c in cands)
+        )
+    capacity = np.bincount(gid, minlength=ngroup).tolist()
+    # 加えた行がある場合, ポテンシャルが最大でない枠は元の行で埋める必要がある.
+    if n < N:
+        vmax = v.max()
+        mandatory = (v[first] < vmax-tol).tolist()
+    else:
+        mandatory = [False]*ngroup
+    slots = [[] for _ in range(ngroup)]
+    for j in range(m):
+        slots[gid[j]].append(j)
+
+    count = 0
+    for choice in _iter_matchings(cands, capacity, mandatory):
+        used = [0]*ngroup
+        sol = []
+        for i, g in enumerate(choice):
+            if used[g] < len(slots[g]):
+                sol.append((i, slots[g][used[g]]))
+            used[g] += 1
+        if abs(sum(C[i, j] for i, j in sol)-optimum) > tol:
+            continue
+        yield sol
+        count += 1
+        if max_solutions is not None and count >= max_solutions:
+            return
+
+
+def _iter_matchings(cands, capacity, mandatory=None):
+    '''
+    各行を候補の枠に割り当てる方法を深さ優先探索で1つずつ生成するジェネレータ.
+    cands[i]は行iを割り当てられる枠のリスト, capacity[g]は枠gに割り当てられる行数,
+    mandatory[g]がTrueの枠gは定員まで埋めなければならない.
+    各行に割り当てた枠のリストを生成する.
+    '''
+    n = len(cands)
+    if mandatory is None:
+        mandatory = [False]*len(capacity)
+    remaining = list(capacity)
+    need = sum(c for c, b in zip(capacity, mandatory) if b)
+    # 候補の少ない行から割り当てる.
+    order = sorted(range(n), key=lambda i: len(cands[i]))
+    chosen = [-1]*n
+    ptr = [0]*(n+1)
+    k = 0
+    while k >= 0:
+        if k == n:
+            yield list(chosen)
+            advanced = False
+        else:
+            i = order[k]
+            advanced = False
+            while ptr[k] < len(cands[i]):
+                g = cands[i][ptr[k]]
+                ptr[k] += 1
+                # 残りの行で埋めなければならない枠を埋められない場合は枝刈りする.
+                if remaining[g] == 0 or need-mandatory[g] > n-k-1:
+                    continue
+                remaining[g] -= 1
+                need -= mandatory[g]
+                chosen[i] = g
+                advanced = True
+                break
+        if advanced:
+            k += 1
+            ptr[k] = 0
+            continue
+        # 1つ前の行の割当を取り消して次の候補を試す.
+        k -= 1
+        if k >= 0:
+            g = chosen[order[k]]
+            remaining[g] += 1
+            need += mandatory[g]
+
+
 class Hungarian:
     '''
     hungarian algorithm.
@@ -229,87 +692,92 @@ class Hungarian:
             raise RuntimeError('正方行列を入力して下さい.')
         self.N = nrow
         self.binary_matrix = np.zeros((self.N, self.N, 2), int)
+        # 値が0である要素による最大マッチング. col4row[i]は行iに対応する列
+        # (無い場合は-1), row4col[j]は列jに対応する行である.
+        # step4では対応した要素が線で1回だけ隠されて0のまま残るため, 次の反復に引き継ぐ.
+        self.col4row = np.full(self.N, -1)
+        self.row4col = np.full(self.N, -1)
 
     def step1(self):
         '''
         各行の要素からその行の最小値を引く.
         各列の要素からその列の最小値を引く.
         '''
-        for i in range(self.N):
-            self.matrix[i, :] -= np.min(self.matrix[i, :])
-        for j in range(self.N):
-            self.matrix[:, j] -= np.min(self.matrix[:, j])
+        self.matrix -= np.min(self.matrix, axis=1, keepdims=True)
+        self.matrix -= np.min(self.matrix, axis=0, keepdims=True)
 
     def step2(self):
         '''
         割当が存在すれば全ての割当を出力する.
+        値が0である要素だけを辿る深さ優先探索で割当を列挙する.
         '''
-        roots = {'0': []}
-        for i in range(self.N):
-            temp = []
-            for j in range(self.N):
-                if self.matrix[i, j] == 0:
-                    temp.append(j)
-            keys = list(roots.keys())
-            for key in keys:
-                for n, j in enumerate(temp):
-                    if j not in roots[key]:
-                        new_key = f'{key}{n}'
-                        roots[new_key] = list(roots[key])
-                        roots[new_key].append(j)
-            for key in keys:
-                roots.pop(key)
+        cands = [
+            np.flatnonzero(self.matrix[i] == 0).tolist() for i in range(self.N)
+        ]
         sols = []
-        for key in roots.keys():
-            if len(roots[key]) == self.N:
-                sol = [(i, j) for i, j in enumerate(roots[key])]
-                sols.append(sol)
+        for sol in _iter_matchings(cands, [1]*self.N):
+            sols.append([(i, j) for i, j in enumerate(sol)])
         return sols
 
     def step3(self):
         '''
         値が0である要素を出来るだけ少ない数の線で隠す.
+        値が0である要素による最大マッチングを求め, Kőnigの定理により
+        対応していない行から交互路で辿れない行と, 辿れる列を線で隠す.
+        線の数は最大マッチングの大きさと等しく, 結果は乱数によらない.
         '''
-        for i in range(self.N):
-            for j in range(self.N):
-                self.binary_matrix[i, j, 0] = 0
-                self.binary_matrix[i, j, 1] = 0
-        for i in range(self.N):
-            for j in range(self.N):
-                if self.matrix[i, j] == 0:
-                    self.binary_matrix[i, j, 0] = 1
+        zeros = self.matrix == 0
+        # 0でなくなった要素の対応を外し, 対応していない行から増加路を探す.
+        rows = np.flatnonzero(self.col4row >= 0)
+        lost = rows[~zeros[rows, self.col4row[rows]]]
+        self.row4col[self.col4row[lost]] = -1
+        self.col4row[lost] = -1
+        for i in np.flatnonzero(self.col4row < 0):
+            self._augment(zeros, i)
+        # 対応していない行から交互路で辿れる行と列.
+        row_reach = self.col4row < 0
+        col_reach = np.zeros(self.N, bool)
+        frontier = row_reach.copy()
+        while frontier.any():
+            cols = zeros[frontier].any(axis=0) & ~col_reach
+            col_reach |= cols
+            # 辿れる列は全て対応しているため, 対応する行に進む.
+            frontier = np.zeros(self.N, bool)
+            frontier[self.row4col[cols]] = True
+            frontier &= ~row_reach
+            row_reach |= frontier
+        row_cover, col_cover = ~row_reach, col_reach
+        self.binary_matrix[:, :, 0] = zeros & ~row_cover[:, None] \
+            & ~col_cover[None, :]
+        self.binary_matrix[:, :, 1] = row_cover[:, None].astype(int) \
+            + col_cover[None, :]
 
-        max_val = {'row': {'ind': 0, 'val': 0}, 'col': {'ind': 0, 'val': 0}}
-        while True:
-            _next = 'row' if np.random.rand() < 0.5 else 'col'
-            max_val['row']['val'] = 0
-            max_val['col']['val'] = 0
-            for i in range(self.N):
-                val = np.sum(self.binary_matrix[i, :, 0])
-                if val > max_val['row']['val']:
-                    max_val['row']['val'] = val
-                    max_val['row']['ind'] = i
-            for j in range(self.N):
-                val = np.sum(self.binary_matrix[:, j, 0])
-                if val > max_val['col']['val']:
-                    max_val['col']['val'] = val
-                    max_val['col']['ind'] = j
-
-            if max_val['row']['val'] == 0 and max_val['col']['val'] == 0:
-                break
-
-            if ((max_val['row']['val'] > max_val['col']['val']) or
-                (max_val['row']['val'] == max_val['col']['val']
-                 and _next == 'row')):
-                i = max_val['row']['ind']
-                for j in range(self.N):
-                    self.binary_matrix[i, j, 0] = 0
-                    self.binary_matrix[i, j, 1] += 1
-            else:
-                j = max_val['col']['ind']
-                for i in range(self.N):
-                    self.binary_matrix[i, j, 0] = 0
-                    self.binary_matrix[i, j, 1] += 1
+    def _augment(self, zeros, root):
+        '''
+        行rootから値が0である要素を辿る幅優先探索で増加路を探し,
+        見つかった場合は最大マッチングを更新してTrueを返す関数.
+        '''
+        prev = np.full(self.N, -1)
+        visited = np.zeros(self.N, bool)
+        rows = np.array([root])
+        while len(rows) != 0:
+            reach = zeros[rows] & ~visited
+            cols = np.flatnonzero(reach.any(axis=0))
+            if len(cols) == 0:
+                return False
+            # 各列には, その列に辿り着いた最初の行から進む.
+            prev[cols] = rows[np.argmax(reach[:, cols], axis=0)]
+            visited[cols] = True
+            free = cols[self.row4col[cols] < 0]
+            if len(free) != 0:
+                j = free[0]
+                while j >= 0:
+                    i = prev[j]
+                    self.col4row[i], j = j, self.col4row[i]
+                    self.row4col[self.col4row[i]] = i
+                return True
+            rows = self.row4col[cols]
+        return False
 
     def step4(self):
         '''
@@ -317,19 +785,11 @@ class Hungarian:
         線で隠れていない要素からmin_valを引き,
         2本の線で隠されている要素にmin_valを足す.
         '''
-        min_val = np.max(self.matrix)
-        for i in range(self.N):
-            for j in range(self.N):
-                if (self.binary_matrix[i, j, 1] == 0 and
-                        min_val > self.matrix[i, j]):
-                    min_val = self.matrix[i, j]
-
-        for i in range(self.N):
-            for j in range(self.N):
-                if self.binary_matrix[i, j, 1] == 0:
-                    self.matrix[i, j] -= min_val
-                elif self.binary_matrix[i, j, 1] == 2:
-                    self.matrix[i, j] += min_val
+        lines = self.binary_matrix[:, :, 1]
+        uncovered = lines == 0
+        min_val = np.min(self.matrix[uncovered])
+        self.matrix[uncovered] -= min_val
+        self.matrix[lines == 2] += min_val
 
     def print_bm(self, channel):
         '''
@@ -359,10 +819,397 @@ class Hungarian:
         '''
         割当を計算する関数.
         '''
-        self.step1()
+        with phase('Hungarian.step1'):
+            self.step1()
+        iteration = 0
         while True:
-            sols = self.step2()
+            with phase('Hungarian.step2'):
+                sols = self.step2()
+            if enabled():
+                emit(
+                    'hungarian_iteration', iteration=iteration,
+                    zeros=int(np.count_nonzero(self.matrix == 0)),
+                    solutions=len(sols)
+                )
             if len(sols) != 0:
                 return sols
-            self.step3()
-            self.step4()
+            with phase('Hungarian.step3'):
+                self.step3()
+            with phase('Hungarian.step4'):
+                self.step4()
+            iteration += 1
+
+
+class LAPJV:
+    '''
+    ポテンシャルと最短増加路を用いたハンガリー法 (Jonker-Volgenant型).
+    n×m行列 (n<=m) の割当問題を, 行を1つずつ加えながら最短増加路で
+    割当を更新することでO(n^2 m)で解く. 各反復は行単位のベクトル演算で行う.
+    n>mの場合は転置して解く.
+    '''
+
+    def __init__(self, matrix):
+        self.matrix = np.array(matrix, float)
+        nrow, ncol = self.matrix.shape
+        self.transposed = nrow > ncol
+        if self.transposed:
+            self.matrix = self.matrix.T
+        self.n, self.m = self.matrix.shape
+        # 行と列のポテンシャル. u[i]+v[j]<=matrix[i,j]を常に満たす.
+        self.u = np.zeros(self.n, float)
+        self.v = np.zeros(self.m, float)
+        self.col4row = np.full(self.n, -1, int)
+        self.row4col = np.full(self.m, -1, int)
+
+    def augment(self, i):
+        '''
+        割当の無い行iを加え, 最短増加路に沿って割当とポテンシャルを更新する.
+        '''
+        C, u, v = self.matrix, self.u, self.v
+        minv = np.full(self.m, np.inf)
+        # way[j]は最短路上で列jの1つ手前の列. -1は行iから直接辿ったことを表す.
+        way = np.full(self.m, -1, int)
+        used = np.zeros(self.m, bool)
+        i0, j0 = i, -1
+        while True:
+            free = ~used
+            cur = C[i0]-u[i0]-v
+            better = free & (cur < minv)
+            minv[better] = cur[better]
+            way[better] = j0
+            masked = np.where(free, minv, np.inf)
+            j1 = int(np.argmin(masked))
+            delta = masked[j1]
+            if delta == np.inf:
+                raise RuntimeError('Augmenting path is not found.')
+            u[i] += delta
+            u[self.row4col[used]] += delta
+            v[used] -= delta
+            minv[free] -= delta
+            if self.row4col[j1] == -1:
+                break
+            used[j1] = True
+            i0, j0 = self.row4col[j1], j1
+        # 最短増加路に沿って割当を入れ替える.
+        j = j1
+        while j != -1:
+            jprev = way[j]
+            r = i if jprev == -1 else self.row4col[jprev]
+            self.row4col[j] = r
+            self.col4row[r] = j
+            j = jprev
+
+    def compute(self):
+        '''
+        割当を計算する関数.
+        (行番号, 列番号) のリストを行番号の昇順で返す.
+        '''
+        with phase('LAPJV.compute'):
+            for i in range(self.n):
+                if self.col4row[i] == -1:
+                    self.augment(i)
+        if self.transposed:
+            return sorted((int(j), i) for i, j in enumerate(self.col4row))
+        return [(i, int(j)) for i, j in enumerate(self.col4row)]
+
+
+class Auction:
+    '''
+    ε-スケーリングを用いたオークション法 (Bertsekas) で割当問題を解くクラス.
+    割当の無い行が, 利益 (費用の符号を反転した値) から価格を引いた値の最も大きい列に,
+    2番目との差+εだけ価格を上げて入札することを, 全ての行に割当が出来るまで繰り返す.
+    εを1/thetaずつepsまで小さくしながら, 前の価格から割当を計算し直す.
+    費用の合計は最適値から行数×eps以内である.
+    n×m行列は, munkresモジュールと同じく値が0の行か列を補った正方行列として扱う.
+    variant='gauss-seidel'では割当の無い行が1つずつ入札し, 価格をすぐに更新する.
+    variant='jacobi'では割当の無い行全てがblock行ずつのベクトル演算で同時に入札し,
+    blockをjobs個のスレッドで並列に計算する. 同じ列への入札は最も高いものだけを受け入れる.
+    '''
+
+    def __init__(
+        self, matrix, eps=1e-6, theta=5., variant=auction[0], block=256,
+        jobs=None
+    ):
+        if variant not in auction:
+            raise RuntimeError(f'Unknown variant: {variant}.')
+        # 入札では行ごとに値を読むため, 行優先の配列にする.
+        self.matrix = np.ascontiguousarray(matrix, float)
+        self.n, self.m = self.matrix.shape
+        self.N = max(self.n, self.m)
+        self.eps = eps
+        self.theta = theta
+        self.variant = variant
+        self.block = block
+        self.jobs = os.cpu_count() if jobs is None else jobs
+        self.price = np.zeros(self.N, float)
+        self.col4row = np.full(self.N, -1, int)
+        self.row4col = np.full(self.N, -1, int)
+        # 入札の延べ数と, εを変えて割当を計算した回数.
+        self.bids = 0
+        self.phases = 0
+
+    def _costs(self, rows):
+        '''
+        行rowsの費用に価格を足した値の行列を返す関数.
+        最も小さい値の列が, 利益から価格を引いた値の最も大きい列である.
+        '''
+        if self.n == self.m:
+            return self.matrix[rows]+self.price
+        V = np.zeros((len(rows), self.N))
+        real = rows < self.n
+        V[real, :self.m] = self.matrix[rows[real]]
+        V += self.price
+        return V
+
+    def _bid(self, rows, eps):
+        '''
+        行rowsが入札する列と入札額の配列を返す関数.
+        '''
+        V = self._costs(rows)
+        k = np.arange(len(rows))
+        cols = np.argmin(V, axis=1)
+        first = V[k, cols]
+        V[k, cols] = np.inf
+        second = V.min(axis=1)
+        # 列が1つしか無い場合は, 2番目との差を0とする.
+        second = np.where(np.isinf(second), first, second)
+        return cols, self.price[cols]+second-first+eps
+
+    def _gauss_seidel(self, eps):
+        '''
+        割当の無い行を1つずつ入札させて, 全ての行に割り当てる関数.
+        '''
+        stack = np.flatnonzero(self.col4row == -1).tolist()
+        self.bids += len(stack)
+        while len(stack) != 0:
+            i = stack.pop()
+            cols, bids = self._bid(np.array([i]), eps)
+            j = int(cols[0])
+            r = self.row4col[j]
+            if r != -1:
+                self.col4row[r] = -1
+                stack.append(r)
+                self.bids += 1
+            self.row4col[j] = i
+            self.col4row[i] = j
+            self.price[j] = bids[0]
+
+    def _jacobi(self, eps, executor=None):
+        '''
+        割当の無い行全てを同時に入札させ, 列ごとに最も高い入札を受け入れることを,
+        全ての行に割り当てるまで繰り返す関数.
+        '''
+        while True:
+            rows = np.flatnonzero(self.col4row == -1)
+            if len(rows) == 0:
+                return
+            self.bids += len(rows)
+            blocks = [
+                rows[k:k+self.block] for k in range(0, len(rows), self.block)
+            ]
+            if executor is None or len(blocks) == 1:
+                results = [self._bid(b, eps) for b in blocks]
+            else:
+                results = list(
+                    executor.map(self._bid, blocks, [eps]*len(blocks))
+                )
+            cols = np.concatenate([c for c, _ in results])
+            bids = np.concatenate([b for _, b in results])
+            # 列ごとに入札額の降順に並べ, 先頭の入札を受け入れる.
+            order = np.lexsort((-bids, cols))
+            head = np.ones(len(order), bool)
+            head[1:] = cols[order[1:]] != cols[order[:-1]]
+            win = order[head]
+            j, i = cols[win], rows[win]
+            r = self.row4col[j]
+            self.col4row[r[r != -1]] = -1
+            self.row4col[j] = i
+            self.col4row[i] = j
+            self.price[j] = bids[win]
+
+    def compute(self):
+        '''
+        割当を計算する関数.
+        補った行と列を除き, (行番号, 列番号) のリストを行番号の昇順で返す.
+        '''
+        with phase('Auction.compute'):
+            span = float(np.ptp(self.matrix)) if self.matrix.size != 0 else 0.
+            # 補った値が0の行か列も価格の幅に含める.
+            if self.n != self.m and self.matrix.size != 0:
+                span = max(
+                    span, abs(float(self.matrix.max())),
+                    abs(float(self.matrix.min()))
+                )
+            eps = max(span/self.theta, self.eps)
+            executor = None
+            parallel = self.jobs > 1 and self.N > self.block
+            if self.variant == auction[1] and parallel:
+                executor = ThreadPoolExecutor(max_workers=self.jobs)
+            try:
+                while True:
+                    # εを小さくした場合は, 価格を残して割当を計算し直す.
+                    self.col4row[:] = -1
+                    self.row4col[:] = -1
+                    if self.variant == auction[0]:
+                        self._gauss_seidel(eps)
+                    else:
+                        self._jacobi(eps, executor)
+                    self.phases += 1
+                    if eps <= self.eps:
+                        break
+                    eps = max(eps/self.theta, self.eps)
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+        if enabled():
+            emit(
+                'auction', variant=self.variant, rows=self.n, cols=self.m,
+                phases=self.phases, bids=self.bids
+            )
+        return [
+            (i, int(j)) for i, j in enumerate(self.col4row[:self.n])
+            if j < self.m
+        ]
+
+
+class Transportation:
+    '''
+    列ごとに定員を持つ割当問題 (輸送問題) を解くクラス.
+    LAPJVクラスと同様に行を1つずつ加えて最短増加路で割当を更新するが,
+    列を定員枠に展開しないため, 計算量とメモリは列数 (教員数) に比例する.
+    行数は定員の合計以下でなければならない.
+    '''
+
+    def __init__(self, matrix, capacity):
+        self.matrix = np.array(matrix, float)
+        self.n, self.m = self.matrix.shape
+        self.capacity = np.array(capacity, int)
+        if self.n > self.capacity.sum():
+            raise RuntimeError('定員の合計が行数より少ないです.')
+        # 行と列のポテンシャル. u[i]+v[j]<=matrix[i,j]を常に満たす.
+        self.u = np.zeros(self.n, float)
+        self.v = np.zeros(self.m, float)
+        self.col4row = np.full(self.n, -1, int)
+        # rows4col[j]は列jに割り当てられた行のリスト.
+        self.rows4col = [[] for _ in range(self.m)]
+        # 最短増加路の探索で到達した列の延べ数.
+        self.scanned = 0
+
+    def augment(self, i):
+        '''
+        割当の無い行iを加え, 最短増加路に沿って割当とポテンシャルを更新する.
+        定員に空きのある列に到達するまで, 到達した列に割り当てられた行全てから
+        まとめて距離を更新する. ポテンシャルは最後にまとめて更新する.
+        '''
+        # dist[j]は行iから列jまでの被約費用の最短距離.
+        # 列jには行wayrow[j]が列way[j]から移って来る. -1は行iを表す.
+        dist, wayrow = self._reduced([i])
+        way = np.full(self.m, -1, int)
+        used = np.zeros(self.m, bool)
+        while True:
+            masked = np.where(used, np.inf, dist)
+            j1 = int(np.argmin(masked))
+            D = masked[j1]
+            if D == np.inf:
+                raise RuntimeError('Augmenting path is not found.')
+            if len(self.rows4col[j1]) < self.capacity[j1]:
+                break
+            used[j1] = True
+            rows = self.rows4col[j1]
+            if len(rows) == 0:
+                continue
+            val, arg = self._reduced(rows)
+            val += D
+            better = ~used & (val < dist)
+            dist[better] = val[better]
+            way[better] = j1
+            wayrow[better] = arg[better]
+        # 到達した列とその行のポテンシャルを, 到達した時点からの距離の差だけ動かす.
+        cols = np.flatnonzero(used)
+        self.scanned += len(cols)
+        diff = D-dist[cols]
+        self.u[i] += D
+        self.v[cols] -= diff
+        lens = [len(self.rows4col[j]) for j in cols]
+        rows = np.array([r for j in cols for r in self.rows4col[j]], int)
+        self.u[rows] += np.repeat(diff, lens)
+        # 最短増加路に沿って行を移す.
+        j = j1
+        while j != -1:
+            r, jprev = wayrow[j], way[j]
+            if jprev != -1:
+                self.rows4col[jprev].remove(r)
+            self.rows4col[j].append(r)
+            self.col4row[r] = j
+            j = jprev
+
+    def _reduced(self, rows):
+        '''
+        行rowsの被約費用matrix[i,j]-u[i]-v[j]の列ごとの最小値と,
+        それを与える行番号の配列を返す関数.
+        '''
+        cur = self.matrix[rows]-self.u[rows, None]-self.v[None, :]
+        best = np.argmin(cur, axis=0)
+        return cur[best, np.arange(self.m)], np.asarray(rows)[best]
+
+    def compute(self):
+        '''
+        割当を計算する関数.
+        (行番号, 列番号) のリストを行番号の昇順で返す.
+        '''
+        return [(i, int(j)) for i, j in enumerate(self.solve())]
+
+    def solve(self):
+        '''
+        割当を計算し, 各行に割り当てた列番号の配列を返す関数.
+        '''
+        with phase(f'{type(self).__name__}.solve'):
+            for i in range(self.n):
+                if self.col4row[i] == -1:
+                    self.augment(i)
+        if enabled():
+            emit(
+                'transportation', rows=self.n, cols=self.m,
+                scanned=self.scanned
+            )
+        return self.col4row.copy()
+
+
+class SparseTransportation(Transportation):
+    '''
+    費用行列をCSR形式で持つTransportationクラス.
+    行iの費用はcost[ptr[i]:ptr[i+1]]に, その列番号はcol[ptr[i]:ptr[i+1]]に並び,
+    並んでいない (行, 列) の組には割り当てない.
+    全ての行が割り当てられるように, 十分な定員を持つ列を含める必要がある.
+    '''
+
+    def __init__(self, ptr, col, cost, capacity):
+        self.ptr = np.asarray(ptr, int)
+        self.col = np.asarray(col, int)
+        self.cost = np.asarray(cost, float)
+        self.lens = np.diff(self.ptr)
+        self.n, self.m = len(self.ptr)-1, len(capacity)
+        self.capacity = np.array(capacity, int)
+        if self.n > self.capacity.sum():
+            raise RuntimeError('定員の合計が行数より少ないです.')
+        self.u = np.zeros(self.n, float)
+        self.v = np.zeros(self.m, float)
+        self.col4row = np.full(self.n, -1, int)
+        self.rows4col = [[] for _ in range(self.m)]
+        self.scanned = 0
+
+    def _reduced(self, rows):
+        rows = np.asarray(rows, int)
+        start, lens = self.ptr[rows], self.lens[rows]
+        # 行rowsの要素の番号を1つの配列にまとめる.
+        offset = np.repeat(start-np.cumsum(lens)+lens, lens)
+        index = offset+np.arange(lens.sum())
+        owner = np.repeat(rows, lens)
+        col = self.col[index]
+        cur = self.cost[index]-self.u[owner]-self.v[col]
+        val = np.full(self.m, np.inf)
+        np.minimum.at(val, col, cur)
+        arg = np.full(self.m, -1, int)
+        hit = cur == val[col]
+        arg[col[hit]] = owner[hit]
+        return val, arg
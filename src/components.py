@@ -0,0 +1,141 @@
+from concurrent.futures import ProcessPoolExecutor
+from instrument import emit, enabled, phase
+from methods import method, solve
+from problem import as_problem
+
+# グローバル変数
+# solve_components関数で記録する各次の配属の統計のうち, 連結成分の間で足し合わせるもの.
+counts = ['applicants', 'assigned', 'seats', 'unassigned']
+
+
+def find_components(data):
+    '''
+    学生と教員を頂点, 志望を辺とするグラフの連結成分を求める関数.
+    各連結成分の学生番号と教員番号の昇順のリストの組を, 学生数の降順に並べたリストで返す.
+    志望の無い学生と誰にも志望されない教員は, 1つの成分にまとめて最後に加える.
+    計算量は志望の総数に対してほぼ線形である.
+    '''
+    problem = as_problem(data)
+    ns, nt = problem.ns, problem.nt
+    ptr, teacher = problem.choice_ptr, problem.choice_teacher
+    # 学生sは頂点s, 教員tは頂点ns+tで表す.
+    parent = list(range(ns+nt))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for s in range(ns):
+        for k in range(ptr[s], ptr[s+1]):
+            a, b = find(s), find(ns+teacher[k])
+            if a != b:
+                parent[b] = a
+    groups = {}
+    rest = ([], [])
+    for s in range(ns):
+        if ptr[s] == ptr[s+1]:
+            rest[0].append(s)
+        else:
+            groups.setdefault(find(s), ([], []))[0].append(s)
+    for t in range(nt):
+        group = groups.get(find(ns+t))
+        if group is None:
+            rest[1].append(t)
+        else:
+            group[1].append(t)
+    components = sorted(groups.values(), key=lambda c: -len(c[0]))
+    if len(rest[0]) != 0 or len(rest[1]) != 0:
+        components.append(rest)
+    return components
+
+
+def solve_components(data, name, jobs=1, rounds=1, stats=None, chains=False):
+    '''
+    find_components関数で求めた連結成分ごとに, methods.pyのsolve関数で
+    アルゴリズムnameの配属を計算し, 1つの配属にまとめる関数.
+    jobsが2以上の場合, 連結成分をjobs個のプロセスで並列に計算する.
+    各連結成分の行列はその成分の学生と定員の大きさになるが, 費用は
+    Problem.subproblem関数により分けずに計算した場合と同じ値になる.
+    DAとRMXの配属は分けずに計算した場合と同じである. 他のアルゴリズムでは
+    学生は同じ連結成分の教員にだけ配属されるため, 近似解となる.
+    志望した教員に配属出来ない学生は, 他の連結成分に不満の自乗の小さい空きがあっても,
+    同じ連結成分の志望していない教員に配属される. そのため不満の自乗の和は,
+    連結成分の学生数が定員の合計以下であっても分けずに計算した場合より大きくなることがある.
+    rounds, stats, chainsはDAの場合だけ用いる. statsには各次の統計を連結成分の間で足し合わせて記録する.
+    '''
+    problem = as_problem(data)
+    with phase('find_components'):
+        components = find_components(problem)
+        subproblems = [problem.subproblem(*c) for c in components]
+    if enabled():
+        emit(
+            'components', components=len(components),
+            students=max((p.ns for p in subproblems), default=0),
+            teachers=max((p.nt for p in subproblems), default=0)
+        )
+    n = len(subproblems)
+    args = [name]*n, [rounds]*n, [chains]*n
+    if jobs == 1 or len(subproblems) <= 1:
+        results = list(map(_solve, subproblems, *args))
+    else:
+        # 小さな連結成分が多い場合に備え, いくつかずつまとめてプロセスに渡す.
+        chunksize = max(1, len(subproblems)//(jobs*4))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(
+                _solve, subproblems, *args, chunksize=chunksize
+            ))
+    assignment = {t: [] for t in problem.teachers}
+    unassigned = []
+    for a, _ in results:
+        for t, slist in a.items():
+            if t == '未配属':
+                unassigned.extend(slist)
+            else:
+                assignment[t] = slist
+    if stats is not None:
+        stats.extend(_merge_stats([x for _, x in results]))
+
+    if len(unassigned) != 0:
+        assignment['未配属'] = unassigned
+    return assignment
+
+
+def _solve(problem, name, rounds=1, chains=False):
+    '''
+    1つの連結成分の配属と, DAの各次の統計のリストを返す関数.
+    行列を作るアルゴリズムでは, 教員のいない成分の学生は全て未配属とする.
+    学生のいない成分は計算しない.
+    '''
+    stats = [] if rounds != 1 else None
+    if problem.nt == 0 and name not in [method[0], method[7]]:
+        return {'未配属': list(problem.students)}, stats
+    if problem.ns == 0:
+        return {t: [] for t in problem.teachers}, stats
+    return solve(
+        problem, name, rounds=rounds, stats=stats, chains=chains
+    ), stats
+
+
+def _merge_stats(stats):
+    '''
+    連結成分ごとの各次の統計を足し合わせる関数.
+    早く打ち切った成分は, 最後の次の未配属の学生が再び応募して配属されなかったものとし,
+    その人数と残りの定員をそのまま足す.
+    '''
+    stats = [x for x in stats if x]
+    merged = []
+    for k in range(max(map(len, stats), default=0)):
+        m = {'round': k+1}
+        m.update(dict.fromkeys(counts, 0))
+        for x in stats:
+            if k < len(x):
+                for key in counts:
+                    m[key] += x[k][key]
+            else:
+                m['applicants'] += x[-1]['unassigned']
+                m['seats'] += x[-1]['seats']-x[-1]['assigned']
+                m['unassigned'] += x[-1]['unassigned']
+        merged.append(m)
+    return merged
@@ -2,8 +2,14 @@ import argparse
 import json
 import pandas as pd
 import numpy as np
+from array import array
 from pathlib import Path
 from pprint import pprint
+from instance import save_npz, sort_data
+from problem import Problem
+
+# グローバル変数
+fmt = ['json', 'npz']
 
 
 def is_file(string):
@@ -53,6 +59,24 @@ def get_arguments():
         出力ディレクトリを指定して下さい.
         '''
     )
+    p.add_argument(
+        '--format',
+        type=str,
+        choices=fmt,
+        default=fmt[0],
+        help='''
+        出力形式を指定して下さい. npzはmain.pyで高速に読み込めるバイナリ形式です.
+        '''
+    )
+    p.add_argument(
+        '--chunksize',
+        type=int,
+        default=None,
+        metavar='N',
+        help='''
+        csv, tsvファイルをN行ずつ読み込みます. 大きなファイルを少ないメモリで変換する場合に指定して下さい.
+        '''
+    )
     args = p.parse_args()
     # 引数の前処理.
     args.input = Path(args.input)
@@ -61,111 +85,217 @@ def get_arguments():
     return args
 
 
-def load(path):
+def load(path, chunksize=None):
     '''
-    入力ファイルを読み込み, pandas.core.frame.DataFrameを返す関数.
+    入力ファイルを読み込み, pandas.core.frame.DataFrameのリストかイテレータを返す関数.
+    表の見出しは内容から探すため, 1行目も見出しではなく値として読み込む.
+    csv, tsvファイルはchunksizeを指定すると, chunksize行ずつ読み込む.
     '''
     if path.suffix in ['.xls', '.xlsx']:
-        df = pd.read_excel(path)
-    elif path.suffix == '.csv':
-        df = pd.read_csv(path)
-    elif path.suffix == '.tsv':
-        df = pd.read_csv(path, sep='\t')
-    return df
-
-
-def switch(bln, pvalue, cvalue):
-    if pvalue is np.nan and cvalue is not np.nan:
-        return True
-    elif pvalue is not np.nan and cvalue is np.nan:
-        return False
-    else:
-        return bln
+        return [pd.read_excel(path, header=None, dtype=object)]
+    sep = '\t' if path.suffix == '.tsv' else ','
+    if chunksize is None:
+        return [pd.read_csv(path, sep=sep, header=None, dtype=object)]
+    return pd.read_csv(
+        path, sep=sep, header=None, dtype=object, chunksize=chunksize
+    )
+
+
+class Reader:
+    '''
+    表を上の行から順に読み込み, Problemを作るクラス.
+    表は複数のDataFrameに分けてfeed関数に渡すことが出来る.
+    '''
+
+    def __init__(self):
+        # 読み込み中の項目 (None, 'choice', 'preference').
+        self.item = None
+        # 次の行が順位の見出しであればTrue.
+        self.header = False
+        # 順位の列の開始位置と列数, 定員の列の位置.
+        self.column, self.width, self.capacity_column = 0, 0, 0
+        self.students, self.choice = [], []
+        self.teachers, self.capacity, self.preference = [], [], []
+        self.sindex = None
+
+    def feed(self, df):
+        '''
+        表の続きdfを読み込む関数.
+        '''
+        values = df.to_numpy(object)
+        # 見出しの行は1列目が空であるため, その行だけから見出しを探す.
+        blank = np.flatnonzero(_blank(values[:, 0]))
+        labels = (values[blank] == 'choice') | (values[blank] == 'preference')
+        start = 0
+        for i in blank[labels.any(axis=1)]:
+            self._rows(values[start:i])
+            self._label(values[i])
+            start = i+1
+        self._rows(values[start:])
+
+    def _label(self, row):
+        '''
+        choice, capacity, preferenceの見出しの行を読み込む関数.
+        '''
+        row = list(row)
+        if 'choice' in row:
+            self.item = 'choice'
+            self.column = row.index('choice')
+        else:
+            if len(self.students) == 0:
+                raise RuntimeError('item \"choice\" is not found.')
+            if 'capacity' not in row:
+                raise RuntimeError('item \"capacity\" is not found.')
+            self.item = 'preference'
+            self.column = row.index('preference')
+            self.capacity_column = row.index('capacity')
+            self.sindex = pd.Index(np.concatenate(self.students))
+        self.header = True
+
+    def _rows(self, values):
+        '''
+        見出しの行の間の行をまとめて読み込む関数.
+        '''
+        if self.item is None or len(values) == 0:
+            return
+        if self.header:
+            # 順位の見出しが続く列の数を, 順位の数とする.
+            filled = np.append(~_blank(values[0, self.column:]), False)
+            self.width = int(np.argmin(filled))
+            self.header = False
+            if self.item == 'preference' and self.width != len(self.sindex):
+                msg = (
+                    f'The number of ranks of preference ranking must be equal to'
+                    + ' The number of students'
+                )
+                raise RuntimeError(msg)
+            values = values[1:]
+        # 名前の無い行 (空行等) は読み飛ばす.
+        values = values[~_blank(values[:, 0])]
+        cells = values[:, self.column:self.column+self.width]
+        # 読み込んだ部分の表全体を保持しないように, 必要な列だけ複製する.
+        if self.item == 'choice':
+            self.students.append(values[:, 0].astype(str))
+            self.choice.append(cells.copy())
+        else:
+            self.teachers.append(values[:, 0].astype(str))
+            self.capacity.append(values[:, self.capacity_column].copy())
+            self.preference.append(_indexer(self.sindex, cells, 'Student'))
+
+    def problem(self):
+        '''
+        読み込んだ表からProblemを作る関数.
+        '''
+        if self.item != 'preference':
+            raise RuntimeError('item \"preference\" is not found.')
+        students = np.concatenate(self.students)
+        teachers = np.concatenate(self.teachers)
+        capacity = pd.to_numeric(np.concatenate(self.capacity))
+        # 志望順位は列の位置とし, 空のセルを除いて学生ごとに並べる.
+        choice = _indexer(
+            pd.Index(teachers), _concatenate(self.choice, self.width), 'Teacher'
+        )
+        choice_ptr, choice_teacher, choice_rank = _csr(choice)
+        # 選好順位は列の位置とし, 教員ごとに学生番号の昇順に並べる.
+        preference = _concatenate(self.preference, len(students))
+        order = np.argsort(
+            np.where(preference < 0, len(students), preference),
+            axis=1, kind='stable'
+        )
+        pref_ptr, pref_student, pref_rank = _csr(
+            np.take_along_axis(preference, order, axis=1), order+1
+        )
+        return Problem(
+            students.tolist(), teachers.tolist(), _int32(capacity),
+            choice_ptr, choice_teacher, choice_rank,
+            pref_ptr, pref_student, pref_rank
+        )
+
+
+def _blank(cells):
+    '''
+    空のセルと空白だけのセルでTrueとなる, cellsと同じ長さの配列を返す関数.
+    '''
+    cells = pd.Series(cells, dtype=object)
+    return (cells.isna() | cells.astype(str).str.strip().eq('')).to_numpy()
+
+
+def _concatenate(blocks, width):
+    '''
+    各行の列数がwidthの配列のリストを, 1つの配列に繋げる関数.
+    '''
+    if len(blocks) == 0:
+        return np.zeros((0, width), np.int64)
+    return np.concatenate(blocks)
+
+
+def _indexer(index, cells, kind):
+    '''
+    名前のセルcellsを, 名前の表indexの番号 (空のセルは-1) に変換する関数.
+    表に無い名前がある場合は例外を送出する.
+    '''
+    filled = pd.notna(cells)
+    codes = np.full(cells.shape, -1, np.int64)
+    codes[filled] = index.get_indexer(cells[filled].astype(str))
+    unknown = filled & (codes < 0)
+    if unknown.any():
+        raise RuntimeError(f'{kind} {cells[unknown][0]} is not found.')
+    return codes
+
+
+def _csr(codes, rank=None):
+    '''
+    番号の行列codes (-1は空) を, 行ごとのCSR形式の配列に変換する関数.
+    順位rankを省略した場合は列の位置を順位とする.
+    '''
+    if rank is None:
+        rank = np.broadcast_to(np.arange(1, codes.shape[1]+1), codes.shape)
+    filled = codes >= 0
+    ptr = np.zeros(len(codes)+1, np.int64)
+    np.cumsum(filled.sum(axis=1), out=ptr[1:])
+    return _int32(ptr), _int32(codes[filled]), _int32(rank[filled])
+
+
+def _int32(values):
+    '''
+    整数の配列をProblemが用いるint32のarrayに変換する関数.
+    '''
+    a = array('i')
+    a.frombytes(np.asarray(values).astype(np.int32).tobytes())
+    return a
 
 
 def convert(df):
     '''
     pandas.core.frame.DataFrameをmain.pyの入力に使用可能なdictに変換する関数.
     '''
-    nrow, ncol = df.shape
-    values = df.values
-
-    # 生徒名と教員名を取得.
-    bln, subli, li = False, [], []
-    for i in range(1, nrow):
-        bln = switch(bln, values[i-1, 0], values[i, 0])
-        if bln:
-            subli.append(values[i, 0])
-        if (bln and i == nrow-1) or (not bln and len(subli) != 0):
-            li.append(subli)
-            subli = []
-
-    S, T = li
-    ns, nt = len(S), len(T)
-    data = {
-        'students': {s: {'choice': {}} for s in S},
-        'teachers': {t: {'preference': {}} for t in T}
-    }
-
-    # 選好順位 (preference) の数が生徒数と一致するか確認.
-    if values[ns+3, 2] != 'preference':
-        raise RuntimeError('item \"preference\" is not found.')
-    bln, counter = False, 0
-    for j in range(2, ncol):
-        bln = switch(bln, values[8, j-1], values[8, j])
-        if bln:
-            counter += 1
-        if not bln and counter != 0:
-            break
-    if counter != ns:
-        msg = (
-            f'The number of ranks of preference ranking must be equal to'
-            + ' The number of students'
-        )
-        raise RuntimeError(msg)
-
-    # 選好順位 (preference) と教員が受け持てる学生の定員数 (capacity) を取得.
-    if values[ns+3, 1] != 'capacity':
-        raise RuntimeError('item \"capacity\" is not found.')
-    for i, t in enumerate(T):
-        data['teachers'][t]['capacity'] = values[i+ns+5, 1]
-        for j in range(ns):
-            s = values[i+ns+5, 2+j]
-            data['teachers'][t]['preference'][s] = j+1
-
-    # 志望順位 (choice) の数 (limit) を取得.
-    if values[0, 1] != 'choice':
-        raise RuntimeError('item \"choice\" is not found.')
-    bln, limit = False, 0
-    for j in range(1, ncol):
-        bln = switch(bln, values[1, j-1], values[1, j])
-        if bln:
-            limit += 1
-        if not bln and limit != 0:
-            break
-
-    # 志望順位 (choice) を取得.
-    for i, s in enumerate(S):
-        for j in range(limit):
-            t = values[i+2, j+1]
-            data['students'][s]['choice'][t] = j+1
-
-    return data
+    reader = Reader()
+    reader.feed(df)
+    return reader.problem().to_data()
 
 
 if __name__ == '__main__':
     args = get_arguments()
-    # 入力の読み込み.
-    df = load(args.input)
-    # 変換
-    data = convert(df)
-    # jsonファイルを出力.
-    name = f'{args.input.stem}.json'
+    # 入力を読み込み, 変換.
+    reader = Reader()
+    for df in load(args.input, args.chunksize):
+        reader.feed(df)
+    problem = reader.problem()
+    # jsonファイルかバイナリ形式のファイルを出力.
+    name = f'{args.input.stem}.{args.format}'
     name_list = [p.name for p in args.output.glob('*')]
     i = 1
     while name in name_list:
-        name = f'{args.input.stem}({i}).json'
+        name = f'{args.input.stem}({i}).{args.format}'
         i += 1
-    with (args.output/name).open(mode='w') as f:
-        text = json.dumps(data, sort_keys=True, ensure_ascii=False, indent=2)
-        f.write(text)
+    if args.format == fmt[1]:
+        save_npz(
+            Problem.from_data(sort_data(problem.to_data())), args.output/name
+        )
+    else:
+        with (args.output/name).open(mode='w') as f:
+            text = json.dumps(
+                problem.to_data(), sort_keys=True, ensure_ascii=False,
+                indent=2
+            )
+            f.write(text)
@@ -0,0 +1,284 @@
+from heapq import heappush, heapreplace
+from operator import add, sub
+from instrument import emit, enabled, phase
+from problem import as_problem
+
+
+def DA(data, rounds=1, stats=None, chains=False):
+    '''
+    deferred acceptance algorithmにより配属を決定する関数.
+    配属が決まらなかった学生はassignment['未配属']に格納される.
+    dataにはmain.pyの入力形式のdictかProblemを指定する.
+    chains=Trueの場合, 不採用になった学生はすぐに次の志望の教員に応募し,
+    学生最適な安定マッチングを求める (_da_resume関数を参照).
+    roundsに2以上を指定すると, 未配属の学生と残りの定員で二次以降の配属を
+    rounds次まで行う (_da_rounds関数を参照).
+    statsにlistを指定すると, 各次の配属の統計を_da_rounds関数の形式で記録する.
+    '''
+    problem = as_problem(data)
+    with phase('_deferred_acceptance'):
+        if rounds == 1 and stats is None:
+            held, unassigned = _da_resume(
+                problem, _da_state(problem, chains=chains)
+            )
+        else:
+            held, unassigned = _da_rounds(problem, rounds, stats, chains)
+    return _da_assignment(problem, held, unassigned)
+
+
+def _da_assignment(problem, held, unassigned):
+    '''
+    _deferred_acceptance関数の結果を配属のdictに変換する関数.
+    '''
+    S = problem.students
+    assignment = {
+        t: [S[i] for i in held[j]] for j, t in enumerate(problem.teachers)
+    }
+    if len(unassigned) != 0:
+        assignment['未配属'] = [S[i] for i in unassigned]
+
+    return assignment
+
+
+def _deferred_acceptance(problem, log=None):
+    '''
+    Problemからdeferred acceptance algorithmを計算する関数.
+    各教員の仮配属者の学生番号のリストと未配属の学生番号のリストを返す.
+    第i志望の回では, 前の回であぶれた学生が第i志望の教員に応募する.
+    各学生の応募先は前にしか進まないため, 計算量は志望の総数に対して線形
+    (ヒープ操作と選好順位の二分探索の分だけ対数倍) である.
+    logにlistを指定すると, 各回の開始時点の状態を_da_snapshot関数の形式で記録する.
+    '''
+    return _da_resume(problem, _da_state(problem), log)
+
+
+def _da_rounds(problem, rounds=1, stats=None, chains=False):
+    '''
+    deferred acceptance algorithmによる配属を, 未配属の学生と残りの定員で
+    最大rounds次まで繰り返す関数.
+    二次以降の配属では, 前の次で未配属となった学生だけが志望順位の最初から応募し直し,
+    各教員は定員から前の次までに配属した学生数を引いた残りの定員で受け入れる.
+    前の次までの配属は確定し, 入れ替えない. 各次の配属はchainsを指定した_da_state関数の
+    状態から計算するため, chains=Falseの一次の配属は_deferred_acceptance関数と同じである.
+    新たに配属された学生がいないか, 未配属の学生か残りの定員が無くなった次で打ち切る.
+    Problemは読み込み直さずに, 定員だけを置き換えて用いる.
+    各教員の配属者の学生番号のリスト (一次, 二次, ...の順) と未配属の学生番号のリストを返す.
+    statsにlistを指定すると, 各次の番号 (round), 応募した学生数 (applicants),
+    配属された学生数 (assigned), 開始時点の残りの定員 (seats) と
+    終了時点の未配属の学生数 (unassigned) のdictを記録する.
+    '''
+    held = [[] for _ in range(problem.nt)]
+    current, students = problem, None
+    for k in range(1, rounds+1):
+        state = _da_state(current, students=students, chains=chains)
+        applicants = sum(map(len, state['rounds']))
+        seats = sum(current.capacity)
+        _held, unassigned = _da_resume(current, state)
+        for h, x in zip(held, _held):
+            h.extend(x)
+        assigned = applicants-len(unassigned)
+        if stats is not None:
+            stats.append({
+                'round': k, 'applicants': applicants, 'assigned': assigned,
+                'seats': seats, 'unassigned': len(unassigned)
+            })
+        if enabled():
+            emit(
+                'assignment_round', round=k, applicants=applicants,
+                assigned=assigned, seats=seats, unassigned=len(unassigned)
+            )
+        # 残りの定員を求め, 未配属の学生を次の配属で応募させる.
+        capacity = [c-len(h) for c, h in zip(problem.capacity, held)]
+        if assigned == 0 or len(unassigned) == 0 or sum(capacity) == 0:
+            break
+        current = problem.with_capacities(capacity)
+        students = sorted(unassigned)
+    return held, unassigned
+
+
+def _da_state(problem, lottery=None, students=None, chains=False):
+    '''
+    deferred acceptance algorithmの第1志望の回の開始時点の状態を返す関数.
+    lotteryには, 選好順位が同じ学生の優先順を決める抽選順位
+    (lottery[t][s]は教員tにおける学生sの抽選順位で, 小さいほど優先) を指定できる.
+    studentsには応募させる学生番号の昇順のリストを指定できる. Noneなら全ての学生である.
+    chainsには_da_resume関数で不採用の連鎖をすぐに辿るかどうかを指定する.
+    '''
+    ptr, level = problem.choice_ptr, problem.choice_rank
+    nrank = max(level, default=0)
+    # rounds[i]は第i志望の回に応募する学生のリスト.
+    rounds = [[] for _ in range(nrank+1)]
+    for s in range(problem.ns) if students is None else students:
+        if ptr[s] < ptr[s+1]:
+            rounds[level[ptr[s]]].append(s)
+    return {
+        'round': 1,
+        'rounds': rounds,
+        'pos': list(ptr[:-1]),
+        # heaps[t]は教員tの仮配属者を, 選好順位が最も低い学生が先頭に来るように保持する.
+        'heaps': [[] for _ in range(problem.nt)],
+        'unassigned': [],
+        'seq': 0,
+        # stamp[s]は学生sを応募待ちか未配属に加えた順番で, 最初の応募は学生番号とする.
+        'stamp': list(range(problem.ns)),
+        'clock': problem.ns,
+        # cut[t]は教員tが最後に学生を不採用にした回の終了時点のseqである.
+        'cut': [0]*problem.nt,
+        'lottery': lottery,
+        'chains': chains
+    }
+
+
+def _da_resume(problem, state, log=None):
+    '''
+    deferred acceptance algorithmを状態stateの回から最後まで計算する関数.
+    stateは計算に合わせて更新される.
+    state['chains']がFalseの場合, 第i志望の回にあぶれた学生は第i志望より後の
+    志望順位の回に応募するため, 仮配属の後に不採用になった学生は
+    その間の志望を飛ばし, 配属が安定でないことがある.
+    Trueの場合, 不採用になった学生はすぐに次の志望の教員に応募し,
+    応募先が無くなるまで不採用の連鎖を辿る. 定員に空きがある教員は応募を全て受け入れ,
+    満員の教員は最も優先しない仮配属者と比べて不採用にするため,
+    結果は学生最適な安定マッチングである (選好順位が同じ場合は先に応募した学生を優先する).
+    '''
+    ptr, teacher, level = (
+        problem.choice_ptr, problem.choice_teacher, problem.choice_rank
+    )
+    capacity = problem.capacity
+    rounds, pos, heaps = state['rounds'], state['pos'], state['heaps']
+    unassigned, stamp = state['unassigned'], state['stamp']
+    seq, clock, cut = state['seq'], state['clock'], state['cut']
+    lottery = state.get('lottery')
+    chains = state.get('chains', False)
+    nrank = max(level, default=0)
+    rounds.extend([] for _ in range(nrank+1-len(rounds)))
+    for i in range(state['round'], len(rounds)):
+        if log is not None:
+            log.append(_da_snapshot(
+                problem, i, rounds, pos, heaps, unassigned, seq, stamp, clock,
+                cut
+            ))
+        # rejected[t]は教員tがこの回に不採用にした学生のエントリのリスト.
+        rejected = {}
+        count = 0
+        # chainsでは, 不採用になった学生をこの回の応募待ちの末尾に加えて続けて応募させる.
+        for s in rounds[i]:
+            t = teacher[pos[s]]
+            r = problem.rank(t, s, float('inf'))
+            # 選好順位が同じ場合は, 抽選順位が小さい学生を,
+            # 抽選が無い場合は先に応募した学生を優先する.
+            if lottery is None:
+                entry = (-r, -seq, s)
+            else:
+                entry = (-r, -lottery[t][s], -seq, s)
+            seq += 1
+            heap = heaps[t]
+            if len(heap) < capacity[t]:
+                heappush(heap, entry)
+                continue
+            if len(heap) != 0 and entry > heap[0]:
+                entry = heapreplace(heap, entry)
+            if not chains:
+                rejected.setdefault(t, []).append(entry)
+                continue
+            cut[t] = seq
+            count += 1
+            s = entry[-1]
+            pos[s] += 1
+            if pos[s] < ptr[s+1]:
+                rounds[i].append(s)
+            else:
+                unassigned.append(s)
+            stamp[s] = clock
+            clock += 1
+        # 定員からあぶれた学生は, 教員番号の順に, 各教員では優先する順に
+        # 次の志望順位で応募する.
+        order = []
+        for t in sorted(rejected):
+            cut[t] = seq
+            order.extend(e[-1] for e in sorted(rejected[t], reverse=True))
+        count += len(order)
+        for s in order:
+            while pos[s] < ptr[s+1] and level[pos[s]] <= i:
+                pos[s] += 1
+            if pos[s] < ptr[s+1]:
+                rounds[level[pos[s]]].append(s)
+            else:
+                unassigned.append(s)
+            stamp[s] = clock
+            clock += 1
+        if enabled():
+            emit(
+                'da_round', round=i, proposals=len(rounds[i]),
+                rejections=count
+            )
+    state.update(round=len(rounds), seq=seq, clock=clock)
+    if log is not None:
+        log.append(_da_snapshot(
+            problem, len(rounds), rounds, pos, heaps, unassigned, seq, stamp,
+            clock, cut
+        ))
+    held = [_held_order(heap, c) for heap, c in zip(heaps, cut)]
+    return held, unassigned
+
+
+def _held_order(heap, cut):
+    '''
+    教員の仮配属者のヒープheapを, 学生番号のリストに並べる関数.
+    最後に学生を不採用にした回までに応募した学生 (seqがcut未満) を優先する順に,
+    その後に応募した学生を応募した順に並べる.
+    応募者を応募順に加え, 定員を超えた回だけ選好順位で安定に並べ替える
+    元のDAの配属結果と同じ順になる.
+    '''
+    entries = sorted(heap, reverse=True)
+    # エントリの最後から2番目の要素は-seqである.
+    held = [e[-1] for e in entries if -e[-2] < cut]
+    later = [e for e in entries if -e[-2] >= cut]
+    held.extend(e[-1] for e in sorted(later, key=lambda e: -e[-2]))
+    return held
+
+
+def _da_snapshot(
+    problem, i, rounds, pos, heaps, unassigned, seq, stamp, clock, cut
+):
+    '''
+    deferred acceptance algorithmの第i志望の回の開始時点の状態を複製する関数.
+    posは各学生の志望の先頭からの位置に直して保持するため,
+    他の学生の志望を変更したProblemにもそのまま使える.
+    proposalsはこの回に応募する学生数の教員ごとのdictである.
+    '''
+    teacher = problem.choice_teacher
+    proposals = {}
+    for s in rounds[i] if i < len(rounds) else []:
+        t = teacher[pos[s]]
+        proposals[t] = proposals.get(t, 0)+1
+    return {
+        'round': i,
+        'rounds': [list(b) for b in rounds[i:]],
+        'pos': list(map(sub, pos, problem.choice_ptr)),
+        'heaps': [list(h) for h in heaps],
+        'unassigned': list(unassigned),
+        'seq': seq,
+        'stamp': list(stamp),
+        'clock': clock,
+        'cut': list(cut),
+        'proposals': proposals
+    }
+
+
+def _da_restore(snapshot, problem):
+    '''
+    _da_snapshot関数で複製した状態から, _da_resume関数に渡す状態を作る関数.
+    '''
+    i = snapshot['round']
+    return {
+        'round': i,
+        'rounds': [[] for _ in range(i)]+[list(b) for b in snapshot['rounds']],
+        'pos': list(map(add, snapshot['pos'], problem.choice_ptr)),
+        'heaps': [list(h) for h in snapshot['heaps']],
+        'unassigned': list(snapshot['unassigned']),
+        'seq': snapshot['seq'],
+        'stamp': list(snapshot['stamp']),
+        'clock': snapshot['clock'],
+        'cut': list(snapshot['cut'])
+    }
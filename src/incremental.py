@@ -0,0 +1,356 @@
+import numpy as np
+from bisect import bisect_left
+from calc_assignment_tools import (
+    Transportation,
+    _calc_A,
+    _calc_W,
+    _calc_w
+)
+from da import (
+    _da_assignment,
+    _da_restore,
+    _deferred_acceptance,
+    _da_resume
+)
+from problem import as_problem
+
+
+class IncrementalDA:
+    '''
+    学生の志望や教員の定員の変更に合わせて, deferred acceptance algorithmの
+    配属を計算し直すクラス.
+    各回の開始時点の状態を記録しておき, 変更が影響する最初の回から計算し直す.
+    計算結果は, 変更後のデータをDA関数で計算した結果と一致する.
+    '''
+
+    def __init__(self, data):
+        self.problem = as_problem(data)
+        self.sindex = {s: i for i, s in enumerate(self.problem.students)}
+        self.tindex = {t: j for j, t in enumerate(self.problem.teachers)}
+        # log[k]は第k+1志望の回の開始時点の状態. 最後の要素は計算終了時の状態である.
+        self.log = []
+        self.held, self.unassigned = _deferred_acceptance(
+            self.problem, self.log
+        )
+
+    @property
+    def assignment(self):
+        '''
+        現在の配属. 形式はDA関数の返り値と同じである.
+        '''
+        return _da_assignment(self.problem, self.held, self.unassigned)
+
+    def update_choice(self, student, choice):
+        '''
+        学生studentの志望をchoice ({教員名: 志望順位}) に置き換え, 配属を返す関数.
+        '''
+        i = self.sindex[student]
+        old = self.problem
+        new = old.with_choice(
+            i, {self.tindex[t]: k for t, k in choice.items()}
+        )
+        r = _first_change(old, new, i)
+        if r is None:
+            self.problem = new
+        else:
+            self._replay(new, r, student=i)
+        return self.assignment
+
+    def withdraw(self, student):
+        '''
+        学生studentを辞退させ, 配属を返す関数.
+        辞退した学生は志望の無い学生として扱い, 配属結果に含めない.
+        '''
+        return self.update_choice(student, {})
+
+    def update_capacity(self, teacher, capacity):
+        '''
+        教員teacherの定員をcapacityに置き換え, 配属を返す関数.
+        '''
+        j = self.tindex[teacher]
+        c = self.problem.capacity[j]
+        new = self.problem.with_capacity(j, capacity)
+        r = None
+        for snapshot in self.log[:-1]:
+            # この回に教員jに応募した後の人数.
+            total = len(snapshot['heaps'][j])+snapshot['proposals'].get(j, 0)
+            # 定員を増やす場合は, 初めて学生を不採用にした回から結果が変わる.
+            # 定員を減らす場合は, 初めて新しい定員まで埋まった回から結果が変わる.
+            if ((capacity > c and total > c) or
+                    (capacity < c and min(c, total) >= capacity)):
+                r = snapshot['round']
+                break
+        if r is None:
+            self.problem = new
+        else:
+            self._replay(new, r)
+        return self.assignment
+
+    def _replay(self, new, r, student=None):
+        '''
+        第r志望の回からProblem newでdeferred acceptance algorithmを計算し直す関数.
+        studentを指定した場合, その学生の志望が変わったものとして,
+        記録した状態のうち第r志望以降の応募待ちと未配属を付け替える.
+        '''
+        old = self.problem
+        k = min(r, self.log[-1]['round'])
+        del self.log[k:]
+        if student is not None:
+            for snapshot in self.log:
+                _requeue(snapshot, student, r, old, new)
+        state = _da_restore(self.log.pop(), new)
+        self.problem = new
+        self.held, self.unassigned = _da_resume(new, state, self.log)
+
+
+def _first_change(old, new, i):
+    '''
+    学生iの志望がoldとnewで初めて異なる志望順位を返す関数. 同じ場合はNoneを返す.
+    '''
+    a, b = old.choice_ptr[i], old.choice_ptr[i+1]
+    c, d = new.choice_ptr[i], new.choice_ptr[i+1]
+    x = list(zip(old.choice_rank[a:b], old.choice_teacher[a:b]))
+    y = list(zip(new.choice_rank[c:d], new.choice_teacher[c:d]))
+    for k in range(max(len(x), len(y))):
+        if k >= len(x):
+            return y[k][0]
+        if k >= len(y):
+            return x[k][0]
+        if x[k] != y[k]:
+            return min(x[k][0], y[k][0])
+    return None
+
+
+def _requeue(snapshot, i, r, old, new):
+    '''
+    記録した状態snapshotで, 学生iが第r志望以降の応募待ちか未配属の場合に,
+    Problem newでの応募先に付け替える関数.
+    学生iの第r志望より前の志望はoldとnewで同じでなければならない.
+    付け替えた学生は, 元の学生と同じ順番で応募待ちか未配属に並べる.
+    '''
+    i0 = snapshot['round']
+    rounds, stamp = snapshot['rounds'], snapshot['stamp']
+    a, b = old.choice_ptr[i], old.choice_ptr[i+1]
+    q = a+snapshot['pos'][i]
+    if q < b:
+        j = old.choice_rank[q]
+        if j < i0 or j < r:
+            # 仮配属中か, 第r志望より前の志望に応募待ちである.
+            return
+        rounds[j-i0].remove(i)
+    elif b > a:
+        snapshot['unassigned'].remove(i)
+    # 新しい志望のうち第r志望以降で最初の志望に応募する.
+    a, b = new.choice_ptr[i], new.choice_ptr[i+1]
+    q = bisect_left(new.choice_rank, r, a, b)
+    snapshot['pos'][i] = q-a
+    if q < b:
+        j = new.choice_rank[q]
+        rounds.extend([] for _ in range(j-i0+1-len(rounds)))
+        queue = rounds[j-i0]
+    elif b > a:
+        queue = snapshot['unassigned']
+    else:
+        return
+    keys = [stamp[s] for s in queue]
+    queue.insert(bisect_left(keys, stamp[i]), i)
+
+
+class IncrementalMCF:
+    '''
+    学生の志望や教員の定員の変更, 学生の辞退に合わせて, MCF関数の配属を
+    ポテンシャルと割当を引き継いで計算し直すクラス.
+    定員の空きを費用0のダミー行で埋め, 未配属の列 (定員は学生数) を加えることで,
+    常に全ての列が定員まで埋まる輸送問題として保持する.
+    変更のあった行だけを割当から外し, 最短増加路で割り当て直す.
+    '''
+
+    def __init__(self, data, unchoice=20):
+        self.problem = as_problem(data)
+        self.unchoice = unchoice
+        self.sindex = {s: i for i, s in enumerate(self.problem.students)}
+        self.tindex = {t: j for j, t in enumerate(self.problem.teachers)}
+        self.withdrawn = np.zeros(self.problem.ns, bool)
+        self._solve()
+
+    def _solve(self):
+        '''
+        現在のProblemで輸送問題を始めから解く関数.
+        '''
+        problem = self.problem
+        ns, nt = problem.ns, problem.nt
+        # 選好の度合いAは志望と定員の変更では変わらないため保持しておく.
+        self.A = _calc_A(problem)
+        self.ilimit = self._ilimit()
+        C = (100.-_calc_W(problem, unchoice=self.unchoice)*self.A)**2
+        # 未配属の列の費用. 志望の変更で費用が変わっても未配属の学生数を最小にするように,
+        # 費用の上限100^2から決める.
+        self.big = 100.**2*ns+1.
+        C = np.hstack([C, np.full((ns, 1), self.big)])
+        C[self.withdrawn] = 0.
+        capacity = np.append(np.asarray(problem.capacity, int), ns)
+        self.transport = _SquareTransportation(C, capacity)
+        self.transport.solve()
+        self.transport.fill()
+
+    def _ilimit(self):
+        '''
+        _calc_W関数が用いる志望順位の範囲.
+        '''
+        crank = np.asarray(self.problem.choice_rank)
+        if crank.size != 0 and crank.max() >= self.unchoice:
+            msg = 'Value of argument unchoice must be greater than max choice ranking number.'
+            raise RuntimeError(msg)
+        return [crank.min(initial=self.unchoice), self.unchoice]
+
+    @property
+    def assignment(self):
+        '''
+        現在の配属. 形式はMCF関数の返り値と同じで, 辞退した学生は含めない.
+        '''
+        S, T = self.problem.students, self.problem.teachers
+        assignment = {t: [] for t in T}
+        unassigned = []
+        for i, j in enumerate(self.transport.col4row[:len(S)]):
+            if self.withdrawn[i]:
+                continue
+            if j < len(T):
+                assignment[T[j]].append(S[i])
+            else:
+                unassigned.append(S[i])
+
+        if len(unassigned) != 0:
+            assignment['未配属'] = unassigned
+        return assignment
+
+    def update_choice(self, student, choice):
+        '''
+        学生studentの志望をchoice ({教員名: 志望順位}) に置き換え, 配属を返す関数.
+        辞退した学生を指定した場合は, 辞退を取り消す.
+        '''
+        i = self.sindex[student]
+        self.problem = self.problem.with_choice(
+            i, {self.tindex[t]: k for t, k in choice.items()}
+        )
+        self.withdrawn[i] = False
+        if self._ilimit() != self.ilimit:
+            # 志望順位の範囲が変わると全ての学生の費用が変わる.
+            self._solve()
+            return self.assignment
+        K = np.full(self.problem.nt, self.unchoice, float)
+        for t, k in choice.items():
+            K[self.tindex[t]] = k
+        W = _calc_w(K, self.ilimit, [100., 50.])
+        self._reassign(i, np.append((100.-W*self.A[i])**2, self.big))
+        return self.assignment
+
+    def withdraw(self, student):
+        '''
+        学生studentを辞退させ, 配属を返す関数.
+        辞退した学生の行は未配属の列を含む全ての列の費用を0とし, 配属結果に含めない.
+        '''
+        i = self.sindex[student]
+        self.withdrawn[i] = True
+        self._reassign(i, np.zeros(self.problem.nt+1))
+        return self.assignment
+
+    def update_capacity(self, teacher, capacity):
+        '''
+        教員teacherの定員をcapacityに置き換え, 配属を返す関数.
+        '''
+        j = self.tindex[teacher]
+        tr = self.transport
+        while tr.capacity[j] < capacity:
+            # 定員を1つ増やし, 空いた枠をダミー行で埋める.
+            tr.capacity[j] += 1
+            tr.augment(tr.add_dummy())
+        while tr.capacity[j] > capacity:
+            # 定員を1つ減らし, ダミー行を1つ取り除く.
+            # 列jにダミー行が無い場合は, 列jの学生を1人外して割り当て直す.
+            tr.capacity[j] -= 1
+            dummies = [r for r in tr.rows4col[j] if r >= tr.nreal]
+            if len(dummies) != 0:
+                tr.remove_dummy(dummies[-1])
+                continue
+            tr.remove_dummy(next(iter(tr.dummies)))
+            r = tr.rows4col[j].pop()
+            tr.col4row[r] = -1
+            tr.augment(r)
+        self.problem = self.problem.with_capacity(j, capacity)
+        return self.assignment
+
+    def _reassign(self, i, cost):
+        '''
+        学生iの各列 (最後の列は未配属) に対する費用をcostに置き換えて,
+        学生iを割り当て直す関数.
+        '''
+        tr = self.transport
+        tr.matrix[i] = cost
+        tr.rows4col[tr.col4row[i]].remove(i)
+        tr.col4row[i] = -1
+        # 全ての列に対してu[i]+v[j]<=matrix[i,j]となるようにポテンシャルを下げる.
+        tr.u[i] = np.min(tr.matrix[i]-tr.v)
+        tr.augment(i)
+
+
+class _SquareTransportation(Transportation):
+    '''
+    定員の空きをダミー行で埋めて保持するTransportationクラス.
+    行番号nreal以上の行はダミー行で, 全ての列の費用は0である.
+    '''
+
+    def __init__(self, matrix, capacity):
+        super().__init__(matrix, capacity)
+        self.nreal = self.n
+        # 割当中のダミー行と, 取り除いて再利用を待つダミー行.
+        self.dummies = set()
+        self.spare = []
+
+    def fill(self):
+        '''
+        solve関数の後に, 定員の空きを全てダミー行で埋める関数.
+        空きのある列のポテンシャルは0なので, ダミー行のポテンシャルも0とする.
+        '''
+        for j in range(self.m):
+            for _ in range(self.capacity[j]-len(self.rows4col[j])):
+                d = self._new_dummy()
+                self.u[d] = 0.
+                self.rows4col[j].append(d)
+                self.col4row[d] = j
+
+    def add_dummy(self):
+        '''
+        割当の無いダミー行を加え, その行番号を返す関数.
+        '''
+        d = self._new_dummy()
+        self.u[d] = -self.v.max()
+        return d
+
+    def remove_dummy(self, d):
+        '''
+        ダミー行dを割当から取り除く関数.
+        '''
+        self.rows4col[self.col4row[d]].remove(d)
+        self.col4row[d] = -1
+        self.dummies.remove(d)
+        self.spare.append(d)
+
+    def _new_dummy(self):
+        if len(self.spare) != 0:
+            d = self.spare.pop()
+        else:
+            d = self.n
+            self.n += 1
+            self.u = np.append(self.u, 0.)
+            self.col4row = np.append(self.col4row, -1)
+        self.dummies.add(d)
+        return d
+
+    def _reduced(self, rows):
+        rows = np.asarray(rows, int)
+        cost = np.zeros((len(rows), self.m))
+        real = rows < self.nreal
+        cost[real] = self.matrix[rows[real]]
+        cur = cost-self.u[rows, None]-self.v[None, :]
+        best = np.argmin(cur, axis=0)
+        return cur[best, np.arange(self.m)], rows[best]
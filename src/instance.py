@@ -0,0 +1,119 @@
+import zipfile
+import numpy as np
+from problem import Problem
+
+# グローバル変数
+# バイナリ形式の版. 形式を変えた場合は値を上げる.
+version = 1
+# Problemの整数配列のうち, バイナリ形式に保存するもの.
+arrays = [
+    'capacity',
+    'choice_ptr',
+    'choice_teacher',
+    'choice_rank',
+    'pref_ptr',
+    'pref_student',
+    'pref_rank',
+]
+
+
+def sort_data(data):
+    '''
+    json.dumpsのsort_keys=Trueで出力したjsonファイルを読み込んだ場合と同じ順に,
+    main.pyの入力形式のdictのキーを並べ替える関数.
+    '''
+    return {
+        'students': {
+            s: {'choice': dict(sorted(v['choice'].items()))}
+            for s, v in sorted(data['students'].items())
+        },
+        'teachers': {
+            t: {
+                'capacity': v['capacity'],
+                'preference': dict(sorted(v['preference'].items()))
+            }
+            for t, v in sorted(data['teachers'].items())
+        }
+    }
+
+
+def save_npz(problem, path):
+    '''
+    Problemをバイナリ形式で保存する関数.
+    名前の表はUTF-8のバイト列と各名前の開始位置の配列で, 順位等はint32の配列で,
+    無圧縮の.npzファイルに保存する.
+    '''
+    members = {'version': np.array([version], np.int32)}
+    for key, names in [
+        ('students', problem.students), ('teachers', problem.teachers)
+    ]:
+        encoded = [s.encode('utf-8') for s in names]
+        offset = np.zeros(len(encoded)+1, np.int64)
+        np.cumsum([len(b) for b in encoded], out=offset[1:])
+        members[f'{key}_data'] = np.frombuffer(b''.join(encoded), np.uint8)
+        members[f'{key}_offset'] = offset
+    for key in arrays:
+        members[key] = np.asarray(getattr(problem, key), np.int32)
+    with open(path, 'wb') as f:
+        np.savez(f, **members)
+
+
+def load_npz(path):
+    '''
+    save_npz関数で保存したファイルからProblemを作る関数.
+    整数配列は読み込まずにメモリマップし, そのままProblemの配列として用いる.
+    '''
+    members = _memmap_npz(path)
+    if int(members['version'][0]) != version:
+        raise RuntimeError(f'Unsupported format version: {path}.')
+    names = {}
+    for key in ['students', 'teachers']:
+        data = members[f'{key}_data'].tobytes()
+        offset = members[f'{key}_offset'].tolist()
+        names[key] = [
+            data[a:b].decode('utf-8') for a, b in zip(offset, offset[1:])
+        ]
+    return Problem(
+        names['students'], names['teachers'],
+        *[_int32_view(members[key]) for key in arrays]
+    )
+
+
+def _int32_view(array):
+    '''
+    int32の配列を, arrayと同じく要素をintで返すmemoryviewに変換する関数.
+    '''
+    return memoryview(np.ascontiguousarray(array, np.int32)).cast('B').cast('i')
+
+
+def _memmap_npz(path):
+    '''
+    無圧縮の.npzファイルの各配列を, np.load(mmap_mode='r')と同じく
+    読み取り専用でメモリマップしたdictを返す関数.
+    np.loadは.npzファイルのメモリマップに対応しないため, zipの中の位置を求めて
+    .npyファイルの配列部分を直接マップする.
+    '''
+    members = {}
+    with zipfile.ZipFile(path) as z, open(path, 'rb') as f:
+        for info in z.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise RuntimeError(f'Compressed member is not supported: {path}.')
+            # ローカルファイルヘッダ (30byte+名前+拡張フィールド) の後に.npyが続く.
+            f.seek(info.header_offset+26)
+            n, m = np.frombuffer(f.read(4), '<u2')
+            f.seek(info.header_offset+30+int(n)+int(m))
+            major, _ = np.lib.format.read_magic(f)
+            if major == 1:
+                header = np.lib.format.read_array_header_1_0(f)
+            else:
+                header = np.lib.format.read_array_header_2_0(f)
+            shape, fortran, dtype = header
+            key = info.filename[:-len('.npy')]
+            if np.prod(shape) == 0:
+                members[key] = np.zeros(shape, dtype)
+                continue
+            members[key] = np.memmap(
+                path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                order='F' if fortran else 'C'
+            )
+    return members
@@ -0,0 +1,129 @@
+import time
+from contextlib import contextmanager
+
+# グローバル変数
+# emit関数で通知を受け取るフックのリスト.
+_hooks = []
+
+
+def add_hook(hook):
+    '''
+    計測の通知を受け取るフックhook(event, fields)を登録する関数.
+    eventは通知の種類を表す文字列, fieldsはその内容のdictである.
+    '''
+    _hooks.append(hook)
+    return hook
+
+
+def remove_hook(hook):
+    '''
+    add_hook関数で登録したフックを取り除く関数.
+    '''
+    _hooks.remove(hook)
+
+
+def enabled():
+    '''
+    フックが登録されている場合Trueを返す関数.
+    通知の内容を求める計算は, この関数がTrueの場合だけ行う.
+    '''
+    return len(_hooks) != 0
+
+
+def emit(event, **fields):
+    '''
+    登録された全てのフックにeventを通知する関数.
+    '''
+    for hook in list(_hooks):
+        hook(event, fields)
+
+
+@contextmanager
+def phase(name):
+    '''
+    with文の中の処理を段階nameとして, 開始 ('enter') と終了 ('exit') を通知する.
+    終了の通知には経過時間[s]を含める.
+    '''
+    if not _hooks:
+        yield
+        return
+    emit('enter', name=name)
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        emit('exit', name=name, time=time.perf_counter()-t)
+
+
+def record_array(name, array):
+    '''
+    配列arrayの形と大きさ[byte]を'array'として通知する関数.
+    '''
+    if _hooks:
+        emit(
+            'array', name=name, shape=list(array.shape),
+            dtype=str(array.dtype), nbytes=int(array.nbytes)
+        )
+
+
+class Profiler:
+    '''
+    通知を集計するフック.
+    段階ごとの呼び出し回数と経過時間, 配列ごとの最大の大きさ,
+    その他の通知を時刻付きで保持する.
+    段階は入れ子の段階名を'/'で繋いだ名前で集計する.
+    '''
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stack = []
+        self.phases = {}
+        self.arrays = {}
+        self.events = []
+
+    def __call__(self, event, fields):
+        if event == 'enter':
+            self.stack.append(fields['name'])
+        elif event == 'exit':
+            key = '/'.join(self.stack)
+            self.stack.pop()
+            p = self.phases.setdefault(key, {'calls': 0, 'time': 0.})
+            p['calls'] += 1
+            p['time'] += fields['time']
+        elif event == 'array':
+            a = self.arrays.get(fields['name'])
+            if a is None or a['nbytes'] < fields['nbytes']:
+                self.arrays[fields['name']] = {
+                    k: v for k, v in fields.items() if k != 'name'
+                }
+        else:
+            self.events.append({
+                'event': event,
+                'phase': '/'.join(self.stack),
+                'time': time.perf_counter()-self.start,
+                **fields
+            })
+
+    def __enter__(self):
+        add_hook(self)
+        return self
+
+    def __exit__(self, *exc):
+        remove_hook(self)
+        return False
+
+    def to_dict(self):
+        '''
+        集計結果をjsonに書き出せるdictで返す関数.
+        途中で中断した場合は, 終了していない段階をunfinishedに含める.
+        '''
+        return {
+            'total': time.perf_counter()-self.start,
+            'unfinished': '/'.join(self.stack),
+            'phases': self.phases,
+            'arrays': self.arrays,
+            'peak_array': max(
+                [a['nbytes'] for a in self.arrays.values()], default=0
+            ),
+            'events': self.events
+        }
@@ -0,0 +1,225 @@
+import argparse
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from da import _da_resume, _da_state
+from main import is_file, is_dir, load_problem, output_name, save
+
+# グローバル変数
+tiebreak = ['single', 'multiple']
+# 1つのタスクで計算する抽選の回数. 並列数によらず同じシードから同じ結果を得るため,
+# 抽選はこの回数ごとのタスクに分けて乱数を割り当てる.
+batch = 100
+# ワーカープロセスごとに読み込んだProblem.
+_problem = None
+
+
+def get_arguments():
+    '''
+    引数処理を行う関数.
+    '''
+    fc = argparse.ArgumentDefaultsHelpFormatter
+    p = argparse.ArgumentParser(
+        formatter_class=fc,
+        description='''
+        選好順位が同じ学生の優先順を抽選で決めてdeferred acceptance algorithmを繰り返し計算し,
+        各学生の配属先の確率と志望順位の平均, 分散を出力するスクリプト.
+        '''
+    )
+    p.add_argument(
+        '--input',
+        type=is_file,
+        required=True,
+        metavar='FILE',
+        help='''
+        入力ファイル (jsonファイルかバイナリ形式の.npzファイル) を指定して下さい.
+        '''
+    )
+    p.add_argument(
+        '--output',
+        type=is_dir,
+        default='./',
+        metavar='DIR',
+        help='''
+        出力ディレクトリを指定して下さい.
+        '''
+    )
+    p.add_argument(
+        '--draws',
+        type=int,
+        default=1000,
+        metavar='INT',
+        help='''
+        抽選の回数を指定して下さい.
+        '''
+    )
+    p.add_argument(
+        '--tiebreak',
+        type=str,
+        choices=tiebreak,
+        default=tiebreak[0],
+        help='''
+        抽選の方法を指定して下さい.
+        singleは全ての教員で共通の, multipleは教員ごとに独立な抽選を行います.
+        '''
+    )
+    p.add_argument(
+        '--seed',
+        type=int,
+        default=None,
+        metavar='INT',
+        help='''
+        乱数のシードを指定して下さい.
+        '''
+    )
+    p.add_argument(
+        '--jobs',
+        type=int,
+        default=1,
+        metavar='N',
+        help='''
+        並列に計算するプロセス数を指定して下さい.
+        '''
+    )
+    args = p.parse_args()
+    # 引数の前処理.
+    args.input = Path(args.input)
+    args.output = Path(args.output)
+
+    return args
+
+
+def draw_lottery(rng, problem, method=tiebreak[0]):
+    '''
+    抽選順位 (lottery[t][s]は教員tにおける学生sの抽選順位) を作る関数.
+    singleでは全ての教員が同じ抽選順位のリストを共有する.
+    '''
+    if method == tiebreak[0]:
+        return [rng.permutation(problem.ns).tolist()]*problem.nt
+    return [rng.permutation(problem.ns).tolist() for _ in range(problem.nt)]
+
+
+def lottery_da(problem, lottery):
+    '''
+    抽選順位lotteryでdeferred acceptance algorithmを計算する関数.
+    配属された学生の志望の位置 (choice_teacherの添字) の配列と,
+    未配属の学生番号のリストを返す.
+    '''
+    state = _da_state(problem, lottery)
+    held, unassigned = _da_resume(problem, state)
+    pos = state['pos']
+    return [pos[s] for h in held for s in h], unassigned
+
+
+def simulate(problem, seed, draws, method=tiebreak[0]):
+    '''
+    シードseedからdraws回の抽選を行い, 志望の位置ごとの配属の回数と,
+    学生ごとの未配属の回数を返す関数.
+    '''
+    rng = np.random.default_rng(seed)
+    assigned = np.zeros(len(problem.choice_teacher), np.int64)
+    unassigned = np.zeros(problem.ns, np.int64)
+    for _ in range(draws):
+        pos, un = lottery_da(problem, draw_lottery(rng, problem, method))
+        assigned += np.bincount(pos, minlength=len(assigned))
+        unassigned += np.bincount(un, minlength=len(unassigned))
+    return assigned, unassigned
+
+
+def _init(path):
+    '''
+    ワーカープロセスの初期化関数. 入力ファイルを1度だけ読み込む.
+    バイナリ形式はメモリマップするため, 各ワーカープロセスで同じページを共有する.
+    '''
+    global _problem
+    _problem = load_problem(path)
+
+
+def _simulate(seed, draws, method):
+    return simulate(_problem, seed, draws, method)
+
+
+def monte_carlo(path, draws, method=tiebreak[0], seed=None, jobs=1):
+    '''
+    入力ファイルpathについて, draws回の抽選をjobs個のプロセスで計算する関数.
+    Problemと, 志望の位置ごとの配属の回数と, 学生ごとの未配属の回数を返す.
+    '''
+    sizes = [min(batch, draws-k) for k in range(0, draws, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    problem = load_problem(path)
+    assigned = np.zeros(len(problem.choice_teacher), np.int64)
+    unassigned = np.zeros(problem.ns, np.int64)
+    if jobs == 1:
+        results = [simulate(problem, s, n, method) for s, n in zip(seeds, sizes)]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init, initargs=(path,)
+        ) as executor:
+            results = list(executor.map(
+                _simulate, seeds, sizes, [method]*len(sizes)
+            ))
+    for a, u in results:
+        assigned += a
+        unassigned += u
+    return problem, assigned, unassigned
+
+
+def summarize(problem, assigned, unassigned, draws):
+    '''
+    monte_carlo関数の結果から, 学生ごとの配属先の確率, 未配属の確率,
+    配属された場合の志望順位の平均と分散をdictで返す関数.
+    一度も配属されなかった学生の志望順位の平均と分散はNoneとする.
+    '''
+    ptr, rank = problem.choice_ptr, problem.choice_rank
+    T = problem.teachers
+    students = {}
+    for i, s in enumerate(problem.students):
+        a, b = ptr[i], ptr[i+1]
+        count = assigned[a:b]
+        r = np.asarray(rank[a:b], np.float64)
+        n = int(count.sum())
+        mean = float(count@r/n) if n != 0 else None
+        students[s] = {
+            'assignment': {
+                T[problem.choice_teacher[k]]: int(c)/draws
+                for k, c in zip(range(a, b), count.tolist()) if c != 0
+            },
+            'unassigned': int(unassigned[i])/draws,
+            'mean_rank': mean,
+            'var_rank': float(count@(r-mean)**2/n) if n != 0 else None
+        }
+    total = int(assigned.sum())
+    return {
+        'draws': draws,
+        'unassigned': float(unassigned.sum())/draws,
+        'mean_rank': float(
+            assigned@np.asarray(rank, np.float64)/total
+        ) if total != 0 else None,
+        'students': students
+    }
+
+
+if __name__ == '__main__':
+    args = get_arguments()
+    t = time.perf_counter()
+    problem, assigned, unassigned = monte_carlo(
+        args.input, args.draws, method=args.tiebreak, seed=args.seed,
+        jobs=args.jobs
+    )
+    elapsed = time.perf_counter()-t
+    report = {
+        'input': str(args.input),
+        'tiebreak': args.tiebreak,
+        'seed': args.seed,
+        'time': elapsed,
+        'draws_per_second': args.draws/elapsed
+    }
+    report.update(summarize(problem, assigned, unassigned, args.draws))
+    print(
+        f'{args.draws} draws in {elapsed:.3f}s '
+        f'({args.draws/elapsed:.1f} draws/s).'
+    )
+    # 集計結果を出力
+    name = output_name(args.output, 'lottery', 'DA', args.input.stem)
+    save(report, args.output, name)
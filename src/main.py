@@ -1,16 +1,18 @@
 import argparse
+import glob
 import json
-import numpy as np
+import sys
+import time
 from pathlib import Path
-from calc_assignment_tools import (
-    DA,
-    MNK,
-    HNG,
-    square_sum_of_dissatisfaction
-)
+from instrument import Profiler, phase
+from methods import method, solve
+from problem import Problem, as_problem
+from stability import check_stability
 
 # グローバル変数
-method = ['DA', 'MNK', 'HNG']
+output_format = ['json', 'ndjson']
+# main.py, lottery.pyの出力ファイルの名前の接頭辞. --inputsではこれらのファイルを除く.
+output_prefix = ['assignment_', 'profile_', 'lottery_']
 
 
 def is_file(string):
@@ -31,6 +33,28 @@ def is_dir(string):
     return string
 
 
+def is_inputs(string):
+    '''
+    引数がディレクトリか, ファイルに一致するglobパターンであるか判定する関数.
+    get_arguments関数で用いている.
+    出力ディレクトリを入力と同じにした場合に前回の配属結果等を入力としないように,
+    名前がoutput_prefixで始まるファイルは除く.
+    '''
+    if Path(string).is_dir():
+        paths = sorted(
+            list(Path(string).glob('*.json'))+list(Path(string).glob('*.npz'))
+        )
+    else:
+        paths = sorted(Path(p) for p in glob.glob(string))
+    paths = [
+        p for p in paths
+        if p.is_file() and not p.name.startswith(tuple(output_prefix))
+    ]
+    if len(paths) == 0:
+        raise argparse.ArgumentTypeError(f'{string} matches no file.')
+    return paths
+
+
 def get_arguments():
     '''
     引数処理を行う関数.
@@ -42,13 +66,23 @@ def get_arguments():
         研究室配属を計算するスクリプト.
         '''
     )
-    p.add_argument(
+    g = p.add_mutually_exclusive_group(required=True)
+    g.add_argument(
         '--input',
         type=is_file,
-        required=True,
         metavar='FILE',
         help='''
-        入力ファイルを指定して下さい.
+        入力ファイル (jsonファイルかバイナリ形式の.npzファイル) を指定して下さい.
+        '''
+    )
+    g.add_argument(
+        '--inputs',
+        type=is_inputs,
+        metavar='DIR_OR_GLOB',
+        help='''
+        複数の入力ファイルをディレクトリ (直下の.json, .npzファイル) か
+        globパターンで指定して下さい.
+        出力ファイル (assignment_, profile_, lottery_で始まるファイル) は除きます.
         '''
     )
     p.add_argument(
@@ -69,6 +103,44 @@ def get_arguments():
         配属の計算に用いるアルゴリズムを指定して下さい.
         '''
     )
+    p.add_argument(
+        '--rounds',
+        type=int,
+        default=1,
+        metavar='N',
+        help='''
+        DAで配属を行う次数の上限を指定して下さい.
+        2以上を指定すると, 未配属の学生と残りの定員で二次以降の配属を行います.
+        '''
+    )
+    p.add_argument(
+        '--chains',
+        action='store_true',
+        help='''
+        DAで, 不採用になった学生がすぐに次の志望の教員に応募する方式
+        (学生最適な安定マッチング) で配属を計算します.
+        指定しない場合は, 第i志望の回に第i志望の教員に応募する方式で計算します.
+        '''
+    )
+    p.add_argument(
+        '--components',
+        action='store_true',
+        help='''
+        学生と教員を志望で結んだグラフの連結成分ごとに配属を計算し, 結果をまとめます.
+        DA, RMX以外のアルゴリズムでは, 学生は同じ連結成分の教員にだけ配属されるため,
+        不満の最小自乗和が分けずに計算した場合より大きくなることがあります.
+        '''
+    )
+    p.add_argument(
+        '--output-format',
+        type=str,
+        choices=output_format,
+        default=output_format[0],
+        help='''
+        配属結果の出力形式を指定して下さい.
+        ndjsonは1行に1人の学生の配属先と志望順位 (student, teacher, rank) を出力します.
+        '''
+    )
     p.add_argument(
         '--verbose',
         action='store_true',
@@ -76,10 +148,57 @@ def get_arguments():
         配属結果を標準出力します.
         '''
     )
+    p.add_argument(
+        '--profile',
+        action='store_true',
+        help='''
+        段階ごとの計算時間や反復回数などの計測結果を,
+        配属結果と同じディレクトリにjsonファイルで出力します.
+        '''
+    )
+    p.add_argument(
+        '--cache',
+        type=str,
+        default=None,
+        metavar='DIR',
+        help='''
+        行列と配属結果を保存するキャッシュディレクトリを指定して下さい.
+        同じ入力とアルゴリズムで再度計算する場合, 保存した結果を用います.
+        '''
+    )
+    p.add_argument(
+        '--cache-size',
+        type=int,
+        default=1024,
+        metavar='MB',
+        help='''
+        キャッシュディレクトリの上限[MB]を指定して下さい.
+        超えた場合は最後に使った時刻が古いものから削除します.
+        '''
+    )
+    p.add_argument(
+        '--jobs',
+        type=int,
+        default=1,
+        metavar='N',
+        help='''
+        --inputsの各ファイルか, --inputと--componentsを指定した場合は
+        各連結成分を並列に計算するプロセス数を指定して下さい.
+        '''
+    )
     args = p.parse_args()
+    if args.rounds < 1:
+        p.error('argument --rounds: must be at least 1.')
+    if args.rounds != 1 and args.method != method[0]:
+        p.error(f'argument --rounds: only available with --method {method[0]}.')
+    if args.chains and args.method != method[0]:
+        p.error(f'argument --chains: only available with --method {method[0]}.')
     # 引数の前処理.
-    args.input = Path(args.input)
+    if args.input is not None:
+        args.input = Path(args.input)
     args.output = Path(args.output)
+    if args.cache is not None:
+        args.cache = Path(args.cache)
 
     return args
 
@@ -94,71 +213,362 @@ def load(path):
     return data
 
 
+def load_problem(path):
+    '''
+    入力ファイル (jsonファイルかバイナリ形式の.npzファイル) を読み込み,
+    Problemを返す関数.
+    ファイルの先頭がzipのシグネチャであればバイナリ形式とみなす.
+    jsonファイルの場合にnumpyを読み込まないように, instance.pyはバイナリ形式の場合だけ読み込む.
+    '''
+    with open(path, 'rb') as f:
+        binary = f.read(4) == b'PK\x03\x04'
+    if binary:
+        # バイナリ形式は整数に符号化したデータを直接読み込む.
+        from instance import load_npz
+        return load_npz(path)
+    # 全てのアルゴリズムで共有する, 整数に符号化したデータを作る.
+    return Problem.from_data(load(path))
+
+
 def save(assignment, path, name):
     '''
     配属結果をjsonファイルで出力する.
+    出力はjson.dumps(assignment, sort_keys=True, ensure_ascii=False, indent=2)と
+    同じであるが, 最上位のキーごとに書き出すため出力全体の文字列は作らない.
     '''
     with (path/name).open('w') as f:
-        text = json.dumps(
-            assignment, sort_keys=True, ensure_ascii=False, indent=2
+        write_json(assignment, f)
+    print(f'{(path/name).resolve()} saved.')
+
+
+def write_json(obj, f):
+    '''
+    objをjson.dumps(obj, sort_keys=True, ensure_ascii=False, indent=2)と
+    同じ形式で, 最上位のキーごとにファイルfに書き出す関数.
+    '''
+    if not isinstance(obj, dict) or len(obj) == 0:
+        f.write(json.dumps(obj, sort_keys=True, ensure_ascii=False, indent=2))
+        return
+    f.write('{')
+    sep = '\n  '
+    for key in sorted(obj):
+        value = json.dumps(
+            obj[key], sort_keys=True, ensure_ascii=False, indent=2
         )
-        f.write(text)
+        f.write(sep)
+        f.write(json.dumps(str(key), ensure_ascii=False))
+        f.write(': ')
+        # 1段深い位置に出力するため, 2行目以降の字下げを増やす.
+        f.write(value.replace('\n', '\n  '))
+        sep = ',\n  '
+    f.write('\n}')
+
+
+def save_ndjson(assignment, data, path, name):
+    '''
+    配属結果を, 1行に1人の学生の配属先と志望順位を持つjson
+    ({"student": 学生名, "teacher": 教員名, "rank": 志望順位}) で出力する.
+    未配属の学生のteacherと, 志望していない教員に配属された学生のrankはnullである.
+    dataにはmain.pyの入力形式のdictかProblemを指定する.
+    '''
+    problem = as_problem(data)
+    sindex = {s: i for i, s in enumerate(problem.students)}
+    with (path/name).open('w') as f:
+        for j, t in enumerate(problem.teachers):
+            for s in assignment.get(t, []):
+                record = {
+                    'student': s,
+                    'teacher': t,
+                    'rank': problem.choice(sindex[s], j)
+                }
+                f.write(json.dumps(record, ensure_ascii=False)+'\n')
+        for s in assignment.get('未配属', []):
+            record = {'student': s, 'teacher': None, 'rank': None}
+            f.write(json.dumps(record, ensure_ascii=False)+'\n')
     print(f'{(path/name).resolve()} saved.')
 
 
-def print_assignment(assignment, data):
+def load_ndjson(path, data=None):
+    '''
+    save_ndjson関数で出力したファイルを1行ずつ読み込み, 配属結果のdictを返す関数.
+    dataにmain.pyの入力形式のdictかProblemを指定すると, 学生が配属されていない教員も
+    空のリストで含め, 配属結果の形式をsolve関数の返り値と同じにする.
+    dataを指定しない場合, 学生が配属されていない教員はdictに含まれない.
+    '''
+    assignment = {}
+    if data is not None:
+        assignment = {t: [] for t in as_problem(data).teachers}
+    with path.open('r') as f:
+        for line in f:
+            if line.strip() == '':
+                continue
+            record = json.loads(line)
+            t = record['teacher']
+            assignment.setdefault('未配属' if t is None else t, []).append(
+                record['student']
+            )
+    return assignment
+
+
+def print_assignment(assignment, data, file=None):
     '''
     配属結果を標準出力する関数.
+    dataにはmain.pyの入力形式のdictかProblemを指定する.
+    教員ごとに書き出すため, 計算量は配属結果の大きさに比例する.
     '''
-    msg = '{\n'
-    for t in data['teachers'].keys():
-        msg += f'  \"{t}\" (capacity: {data["teachers"][t]["capacity"]}): [\n'
-        for s in assignment[t]:
-            if t in data["students"][s]["choice"].keys():
-                k = data["students"][s]["choice"][t]
-            else:
-                k = None
-            msg += f'    \"{s}\" (choice: {k}),\n'
-        if len(assignment[t]) == 0:
-            msg = msg[:-1]
-        else:
-            msg = msg[:-2]
-            msg += '\n  '
-        msg += '],\n'
+    problem = as_problem(data)
+    file = sys.stdout if file is None else file
+    sindex = {s: i for i, s in enumerate(problem.students)}
+    file.write('{\n')
+    sep = ''
+    for j, t in enumerate(problem.teachers):
+        head = f'  "{t}" (capacity: {problem.capacity[j]}): ['
+        lines = [
+            f'    "{s}" (choice: {problem.choice(sindex[s], j)})'
+            for s in assignment.get(t, [])
+        ]
+        file.write(sep+head)
+        if len(lines) != 0:
+            file.write('\n'+',\n'.join(lines)+'\n  ')
+        file.write(']')
+        sep = ',\n'
     if '未配属' in assignment.keys():
-        msg += '  \"未配属\": [\n'
-        for s in assignment['未配属']:
-            msg += f'    \"{s}\",\n'
-        msg = msg[:-2]
-        msg += '\n  ],\n'
-    msg = msg[:-2]
-    msg += '\n}'
-    print(msg)
+        lines = [f'    "{s}"' for s in assignment['未配属']]
+        file.write(sep+'  "未配属": [\n'+',\n'.join(lines)+'\n  ]')
+    file.write('\n}\n')
+
+
+def solve_cached(
+    problem, name, cache=None, rounds=1, stats=None, chains=False,
+    components=False, jobs=1
+):
+    '''
+    キャッシュcache (cache.pyのCache) を指定した場合, 同じ入力とアルゴリズムの
+    配属結果を再利用するsolve関数.
+    キャッシュした配属結果を用いた場合, statsには何も記録しない.
+    '''
+    kwargs = {
+        'rounds': rounds, 'stats': stats, 'chains': chains,
+        'components': components, 'jobs': jobs
+    }
+    if cache is None:
+        return solve(problem, name, **kwargs)
+    from cache import decode_assignment, encode_assignment
+    # 一次だけの配属は, --roundsを加える前と同じキーにする.
+    params = ('assignment', name)
+    if rounds != 1:
+        params += (rounds,)
+    if chains:
+        params += ('chains',)
+    if components:
+        params += ('components',)
+    key = cache.key(problem, *params)
+    arrays = cache.get(key)
+    if arrays is not None:
+        return decode_assignment(arrays, problem)
+    assignment = solve(problem, name, **kwargs)
+    cache.put(key, encode_assignment(assignment, problem))
+    return assignment
+
+
+def print_stability(pairs, envy):
+    '''
+    check_stability関数で求めたブロッキングペアと,
+    正当な羨望を持つ学生の数を標準出力する関数.
+    '''
+    lines = [f'Blocking pairs:\n  {len(pairs)}']
+    lines.extend(f'    "{s}" - "{t}"' for s, t in pairs)
+    n = sum(1 for c in envy.values() if c != 0)
+    lines.append(f'Students with justified envy:\n  {n}')
+    print('\n'.join(lines))
+
+
+def print_rounds(stats):
+    '''
+    da.pyの_da_rounds関数で記録した各次の配属の統計を標準出力する関数.
+    '''
+    lines = ['Rounds:']
+    lines.extend(
+        f'  {x["round"]}: {x["applicants"]} applicants, '
+        f'{x["assigned"]} assigned, {x["seats"]} seats, '
+        f'{x["unassigned"]} unassigned'
+        for x in stats
+    )
+    print('\n'.join(lines))
+
+
+def output_name(output, prefix, name, stem, suffix='json'):
+    '''
+    outputに既に存在するファイルと重ならない, 出力ファイルの名前を返す関数.
+    '''
+    fname = f'{prefix}_{name}_{stem}.{suffix}'
+    name_list = [p.name for p in output.glob('*')]
+    i = 1
+    while fname in name_list:
+        fname = f'{prefix}_{name}_{stem}({i}).{suffix}'
+        i += 1
+    return fname
+
+
+def run(
+    path, output, name, verbose=False, score=False, profile=False,
+    cache=None, cache_size=1024, output_format='json', rounds=1,
+    chains=False, components=False, jobs=1
+):
+    '''
+    入力ファイルpathの配属をアルゴリズムnameで計算し, outputに出力する関数.
+    各段階の計算時間[s]と不満の最小自乗和 (未配属の学生がいる場合はNone) を
+    dictで返す.
+    profile=Trueの場合, 計測結果をoutputにjsonファイルで出力する.
+    計算が例外や中断で終了した場合も, それまでの計測結果を出力する.
+    cacheにはキャッシュディレクトリを, cache_sizeにはその上限[MB]を指定する.
+    cacheがNoneの場合も, 同じ計算の中で作った行列はメモリ上で再利用する.
+    ただし, DAかRMXだけを計算する場合は行列を作らないため, キャッシュを用いない.
+    output_formatには配属結果の出力形式 ('json'か'ndjson') を指定する.
+    roundsにはDAで配属を行う次数の上限を指定する.
+    chains=Trueの場合, DAで学生最適な安定マッチングを求める.
+    components=Trueの場合, 連結成分ごとにjobs個のプロセスで配属を計算する.
+    '''
+    store = None
+    matrix = name not in [method[0], method[7]]
+    if cache is not None or matrix or verbose or score:
+        from cache import Cache
+        from calc_assignment_tools import set_cache
+        store = Cache(cache, max_bytes=cache_size*2**20)
+        set_cache(store)
+    if not profile:
+        return _run(
+            path, output, name, verbose=verbose, score=score,
+            output_format=output_format, cache=store, rounds=rounds,
+            chains=chains, components=components, jobs=jobs
+        )
+    with Profiler() as profiler:
+        try:
+            return _run(
+                path, output, name, verbose=verbose, score=score,
+                output_format=output_format, cache=store, rounds=rounds,
+                chains=chains, components=components, jobs=jobs
+            )
+        finally:
+            trace = {'input': str(path), 'method': name}
+            trace.update(profiler.to_dict())
+            save(trace, output, output_name(output, 'profile', name, path.stem))
+
+
+def _run(
+    path, output, name, verbose=False, score=False, output_format='json',
+    cache=None, rounds=1, chains=False, components=False, jobs=1
+):
+    '''
+    run関数の本体. cacheにはcache.pyのCacheを指定する.
+    '''
+    summary = {'input': str(path), 'method': name}
+    t = time.perf_counter()
+    with phase('load'):
+        problem = load_problem(path)
+    summary['load'] = time.perf_counter()-t
+    # 配属を計算.
+    t = time.perf_counter()
+    stats = [] if rounds != 1 else None
+    with phase('solve'):
+        assignment = solve_cached(
+            problem, name, cache, rounds=rounds, stats=stats, chains=chains,
+            components=components, jobs=jobs
+        )
+    summary['solve'] = time.perf_counter()-t
+    summary['unassigned'] = len(assignment.get('未配属', []))
+    summary['ssd'] = None
+    if (verbose or score) and summary['unassigned'] == 0:
+        from calc_assignment_tools import square_sum_of_dissatisfaction
+        with phase('score'):
+            summary['ssd'] = square_sum_of_dissatisfaction(
+                assignment, problem
+            )
+    # 配属結果を標準出力.
+    if verbose:
+        print_assignment(assignment, problem)
+        if stats:
+            print_rounds(stats)
+        if summary['ssd'] is not None:
+            print(f'Square sum of dissatisfaction:\n  {summary["ssd"]}')
+        with phase('stability'):
+            pairs, envy = check_stability(assignment, problem)
+        print_stability(pairs, envy)
+    # 配属結果を出力.
+    t = time.perf_counter()
+    with phase('save'):
+        fname = output_name(
+            output, 'assignment', name, path.stem, suffix=output_format
+        )
+        if output_format == 'ndjson':
+            save_ndjson(assignment, problem, output, fname)
+        else:
+            save(assignment, output, fname)
+    summary['save'] = time.perf_counter()-t
+    return summary
+
+
+def print_summary(summaries):
+    '''
+    run関数が返した計算時間と不満の最小自乗和を表にして標準出力する関数.
+    計算に失敗したファイル (errorを持つdict) は, 計算時間の代わりにエラーを表示する.
+    '''
+    width = max([len(Path(x['input']).name) for x in summaries]+[5])
+    lines = [
+        f'{"input":<{width}}  method  {"load[s]":>8}  {"solve[s]":>8}  '
+        f'{"save[s]":>8}  {"unassigned":>10}  {"ssd":>14}'
+    ]
+    for x in summaries:
+        if 'error' in x:
+            lines.append(
+                f'{Path(x["input"]).name:<{width}}  {x["method"]:<6}  '
+                f'failed: {x["error"]}'
+            )
+            continue
+        ssd = '-' if x['ssd'] is None else f'{x["ssd"]:.3f}'
+        lines.append(
+            f'{Path(x["input"]).name:<{width}}  {x["method"]:<6}  '
+            f'{x["load"]:8.3f}  {x["solve"]:8.3f}  {x["save"]:8.3f}  '
+            f'{x["unassigned"]:10d}  {ssd:>14}'
+        )
+    print('\n'.join(lines))
 
 
 if __name__ == '__main__':
     # 引数処理.
     args = get_arguments()
-    # データを読み込む.
-    data = load(args.input)
-    # 配属を計算.
-    if args.method == method[0]:
-        assignment = DA(data)
-    elif args.method == method[1]:
-        assignment = MNK(data)
+    if args.input is not None:
+        run(
+            args.input, args.output, args.method,
+            verbose=args.verbose, profile=args.profile,
+            cache=args.cache, cache_size=args.cache_size,
+            output_format=args.output_format, rounds=args.rounds,
+            chains=args.chains, components=args.components, jobs=args.jobs
+        )
     else:
-        assignment = HNG(data)
-    # 配属結果を標準出力.
-    if args.verbose:
-        print_assignment(assignment, data)
-        if '未配属' not in assignment.keys():
-            ssd = square_sum_of_dissatisfaction(assignment, data)
-            print(f'Square sum of dissatisfaction:\n  {ssd}')
-    # 配属結果を出力.
-    name = f'assignment_{args.method}_{args.input.stem}.json'
-    name_list = [p.name for p in args.output.glob('*')]
-    i = 1
-    while name in name_list:
-        name = f'assignment_{args.method}_{args.input.stem}({i}).json'
-        i += 1
-    save(assignment, args.output, name)
+        # 複数の入力ファイルをプロセスプールで並列に計算する.
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            futures = [
+                executor.submit(
+                    run, path, args.output, args.method,
+                    verbose=args.verbose, score=True, profile=args.profile,
+                    cache=args.cache, cache_size=args.cache_size,
+                    output_format=args.output_format, rounds=args.rounds,
+                    chains=args.chains, components=args.components
+                )
+                for path in args.inputs
+            ]
+            summaries = []
+            # 1つのファイルの失敗で他のファイルの結果を失わないように, 例外は表に記録する.
+            for path, f in zip(args.inputs, futures):
+                try:
+                    summaries.append(f.result())
+                except Exception as e:
+                    summaries.append({
+                        'input': str(path), 'method': args.method,
+                        'error': f'{type(e).__name__}: {e}'
+                    })
+        print_summary(summaries)
+        if any('error' in x for x in summaries):
+            sys.exit(1)
@@ -1,10 +1,18 @@
 import argparse
 import json
 import numpy as np
+from array import array
 from pathlib import Path
+from instance import save_npz
+from problem import Problem
 
 # グローバル変数
 opt = ['random', 'separate']
+fmt = ['json', 'npz']
+model = ['uniform', 'zipf', 'mallows']
+pref = ['identical', 'independent', 'correlated']
+# 一度に志望を作る学生数. 学生数×教員数の乱数行列の大きさを抑える.
+block = 2**16
 
 
 def is_file(string):
@@ -81,6 +89,61 @@ def get_arguments():
         デモデータ作製時のオプションを指定して下さい.
         '''
     )
+    p.add_argument(
+        '--model',
+        type=str,
+        choices=model,
+        default=model[0],
+        help='''
+        生徒の志望の作り方を指定して下さい.
+        '''
+    )
+    p.add_argument(
+        '--skew',
+        type=float,
+        default=1.0,
+        metavar='FLOAT',
+        help='''
+        --model zipfの場合の, 教員の人気の偏り (Zipf分布の指数) を指定して下さい.
+        '''
+    )
+    p.add_argument(
+        '--phi',
+        type=float,
+        default=0.5,
+        metavar='FLOAT',
+        help='''
+        --model mallowsの場合の, 志望の散らばり (0以上1以下) を指定して下さい.
+        0では全ての生徒の志望が人気順と一致し, 1ではuniformと同じになります.
+        '''
+    )
+    p.add_argument(
+        '--pref',
+        type=str,
+        choices=pref,
+        default=pref[0],
+        help='''
+        教員の選好順位の作り方を指定して下さい.
+        '''
+    )
+    p.add_argument(
+        '--seed',
+        type=int,
+        default=None,
+        metavar='INT',
+        help='''
+        乱数のシードを指定して下さい. 同じシードと引数からは同じデモデータが作製されます.
+        '''
+    )
+    p.add_argument(
+        '--format',
+        type=str,
+        choices=fmt,
+        default=fmt[0],
+        help='''
+        出力形式を指定して下さい. npzはmain.pyで高速に読み込めるバイナリ形式です.
+        '''
+    )
     args = p.parse_args()
     # 引数の前処理.
     args.output = Path(args.output)
@@ -88,82 +151,183 @@ def get_arguments():
     return args
 
 
-def random_choice(data, limit=None):
+def names(prefix, n):
     '''
-    各教員に対する生徒の志望順位をランダムに設定する関数.
+    名前f'{prefix}_{i}' (i=0, ..., n-1) を文字列の昇順に並べたリストと,
+    各名前の番号iの配列を返す関数.
+    json.dumpsのsort_keys=Trueで出力したjsonファイルを読み込んだ場合と同じ順になる.
     '''
-    tea = list(data['teachers'].keys())
-    if limit is None or limit > len(tea):
-        limit = len(tea)
-    for s in data['students'].keys():
-        np.random.shuffle(tea)
-        for i, t in enumerate(tea[:limit]):
-            data['students'][s]['choice'][t] = i+1
+    ids = np.argsort(np.arange(n).astype(str), kind='stable')
+    return [f'{prefix}_{i}' for i in ids.tolist()], ids
 
 
-def separate_choice(data, limit=None):
+def make_capacity(rng, ns, nt):
     '''
-    全ての生徒が第1志望の教員に配属されるように, 各教員に対する生徒の志望順位を設定する関数.
+    各生徒をランダムな教員に割り振り, 教員が受け入れ可能な学生数を設定する関数.
+    定員の合計は生徒数と等しい.
     '''
-    tea = set(data['teachers'].keys())
-    if limit is None or limit > len(tea):
-        limit = len(tea)
-    capacity = {t: data['teachers'][t]['capacity'] for t in tea}
-    # 第1志望の設定.
-    for s in data['students'].keys():
-        p = np.array(list(capacity.values()))
-        t = np.random.choice(list(capacity.keys()), p=p/float(p.sum()))
-        data['students'][s]['choice'][t] = 1
-        capacity[t] -= 1
-    # 第2志望以降の設定.
-    for s in data['students'].keys():
-        _tea = list(tea-set(data['students'][s]['choice'].keys()))
-        np.random.shuffle(_tea)
-        for i, t in enumerate(_tea[:limit-1]):
-            data['students'][s]['choice'][t] = i+2
+    return np.bincount(rng.integers(nt, size=ns), minlength=nt)
+
+
+def make_choice(
+    rng, n, nt, limit, model=model[0], first=None, weight=None, reference=None,
+    phi=0.5
+):
+    '''
+    n人の生徒の志望を, 志望順に教員番号を並べた(n, limit)の配列で返す関数.
+    firstを指定した場合は, 第1志望をfirstとする.
+    uniformでは全ての教員を同じ確率で, zipfでは教員の人気weightに比例する確率で,
+    重複無しに順に選ぶ (乱数の鍵の上位limit個を選ぶ).
+    mallowsでは人気順referenceに近い順列ほど選ばれやすいMallows分布に従う.
+    '''
+    if model == 'mallows':
+        return _mallows_choice(rng, n, nt, limit, reference, phi, first)
+    keys = rng.random((n, nt))
+    if model == 'zipf':
+        # Gumbel-max trick. log(weight)+Gumbel乱数の降順が, weightに比例する非復元抽出になる.
+        keys = np.log(weight)-np.log(-np.log(keys))
+    if first is not None:
+        keys[np.arange(n), first] = np.inf
+    top = np.argpartition(-keys, limit-1, axis=1)[:, :limit]
+    order = np.argsort(-np.take_along_axis(keys, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def _mallows_choice(rng, n, nt, limit, reference, phi, first=None):
+    '''
+    Mallows分布に従う志望を作る関数.
+    順列の挿入ベクトル (人気順referenceの残りの教員のうち何番目を選ぶか) は,
+    各位置で独立に打ち切り幾何分布 (c番目を選ぶ確率がphi**cに比例) に従う.
+    '''
+    position = np.empty(nt, np.int64)
+    position[reference] = np.arange(nt)
+    remain = np.ones((n, nt), bool)
+    choice = np.empty((n, limit), np.int64)
+    rows = np.arange(n)
+    start = 0
+    if first is not None:
+        choice[:, 0] = first
+        remain[rows, position[first]] = False
+        start = 1
+    for i in range(start, limit):
+        m = nt-i
+        if phi >= 1:
+            c = rng.integers(m, size=n)
+        elif phi <= 0:
+            c = np.zeros(n, np.int64)
+        else:
+            u = rng.random(n)
+            c = np.floor(np.log1p(-u*(1-phi**m))/np.log(phi)).astype(np.int64)
+            c = np.minimum(c, m-1)
+        # 残りの教員のうちc番目 (0始まり) の, 人気順での位置.
+        k = np.argmax(np.cumsum(remain, axis=1) > c[:, None], axis=1)
+        choice[:, i] = reference[k]
+        remain[rows, k] = False
+    return choice
+
+
+def make_preference(rng, sid, nt, preference=pref[0]):
+    '''
+    各教員の生徒の選好順位を, (nt, 生徒数)の配列で返す関数.
+    identicalでは全ての教員が生徒の番号sidの順に, independentでは教員ごとに
+    独立なランダムな順に, correlatedでは共通の成績に教員ごとの雑音を加えた順に選好する.
+    '''
+    ns = len(sid)
+    if preference == 'identical':
+        return np.broadcast_to(sid+1, (nt, ns))
+    rank = np.empty((nt, ns), np.int32)
+    if preference == 'independent':
+        for j in range(nt):
+            rank[j] = rng.permutation(ns)+1
+        return rank
+    score = rng.standard_normal(ns)
+    for j in range(nt):
+        order = np.argsort(-(score+rng.standard_normal(ns)), kind='stable')
+        rank[j, order] = np.arange(1, ns+1)
+    return rank
+
+
+def make_problem(
+    ns, nt, limit=None, option=opt[0], seed=None, model=model[0],
+    skew=1.0, phi=0.5, preference=pref[0]
+):
+    '''
+    生徒数ns, 教員数ntのデモデータをProblemで作製する関数.
+    limitは志望順位の数, optionはデモデータ作製時のオプション, seedは乱数のシード,
+    modelは志望の作り方 (skew, phiはそのパラメタ), preferenceは選好順位の作り方である.
+    生徒と教員は名前の文字列の昇順に並ぶ.
+    '''
+    if limit is None or limit > nt:
+        limit = nt
+    rng = np.random.default_rng(seed)
+    students, sid = names('Student', ns)
+    teachers, _ = names('Teacher', nt)
+    capacity = make_capacity(rng, ns, nt)
+    # 教員の人気順 (人気の高い順に教員番号を並べた配列) と, Zipf分布の人気.
+    reference = rng.permutation(nt)
+    weight = np.empty(nt)
+    weight[reference] = 1/np.arange(1, nt+1)**skew
+    # separateでは, 定員に合わせて全ての生徒の第1志望を決める.
+    if option == opt[1]:
+        first = rng.permutation(np.repeat(np.arange(nt), capacity))
+    choice = np.empty((ns, limit), np.int64)
+    for a in range(0, ns, block):
+        b = min(a+block, ns)
+        choice[a:b] = make_choice(
+            rng, b-a, nt, limit, model=model,
+            first=first[a:b] if option == opt[1] else None,
+            weight=weight, reference=reference, phi=phi
+        )
+    rank = make_preference(rng, sid, nt, preference=preference)
+    return Problem(
+        students, teachers, _int32(capacity),
+        _int32(np.arange(0, ns*limit+1, limit)),
+        _int32(choice),
+        _int32(np.broadcast_to(np.arange(1, limit+1), (ns, limit))),
+        _int32(np.arange(0, nt*ns+1, ns)),
+        _int32(np.broadcast_to(np.arange(ns), (nt, ns))),
+        _int32(rank)
+    )
+
+
+def _int32(values):
+    '''
+    整数の配列をProblemが用いるint32のarrayに変換する関数.
+    '''
+    a = array('i')
+    a.frombytes(np.ascontiguousarray(values, np.int32).tobytes())
+    return a
+
+
+def make_data(ns, nt, limit=None, option=opt[0], **kwargs):
+    '''
+    生徒数ns, 教員数ntのデモデータを作製する関数.
+    limitは志望順位の数, optionはデモデータ作製時のオプションである.
+    その他の引数はmake_problem関数と同じである.
+    '''
+    return make_problem(ns, nt, limit=limit, option=option, **kwargs).to_data()
 
 
 if __name__ == '__main__':
     args = get_arguments()
-    data = {
-        'students': {},
-        'teachers': {}
-    }
-    # 学生の名前を設定.
-    for i in range(args.ns):
-        name = f'Student_{i}'
-        data['students'][name] = {
-            'choice': {}
-        }
-    # 教員の名前を設定.
-    for i in range(args.nt):
-        name = f'Teacher_{i}'
-        data['teachers'][name] = {
-            'capacity': 0,
-            'preference': {}
-        }
-    # 教員が受け入れ可能な学生数を設定.
-    tea = list(data['teachers'].keys())
-    for i in range(args.ns):
-        name = np.random.choice(tea)
-        data['teachers'][name]['capacity'] += 1
-    # 各学生に対する教員の選好順位を設定.
-    stu = list(data['students'].keys())
-    for t in tea:
-        for i, s in enumerate(stu):
-            data['teachers'][t]['preference'][s] = i+1
-    # 各教員に対する生徒の志望順位を設定.
-    if args.opt == opt[0]:
-        random_choice(data, limit=args.limit)
-    else:
-        separate_choice(data, limit=args.limit)
+    problem = make_problem(
+        args.ns, args.nt, limit=args.limit, option=args.opt, seed=args.seed,
+        model=args.model, skew=args.skew, phi=args.phi, preference=args.pref
+    )
     # デモデータを出力
-    name = f'demodata_{args.opt}.json'
+    name = f'demodata_{args.opt}.{args.format}'
     name_list = [p.name for p in args.output.glob('*')]
     i = 1
     while name in name_list:
-        name = f'demodata_{args.opt}({i}).json'
+        name = f'demodata_{args.opt}({i}).{args.format}'
         i += 1
-    with (args.output/name).open(mode='w') as f:
-        text = json.dumps(data, sort_keys=True, ensure_ascii=False, indent=2)
-        f.write(text)
+    if args.format == fmt[1]:
+        # 生徒と教員は既に名前の順に並ぶため, そのまま保存する.
+        save_npz(problem, args.output/name)
+    else:
+        with (args.output/name).open(mode='w') as f:
+            text = json.dumps(
+                problem.to_data(), sort_keys=True, ensure_ascii=False,
+                indent=2
+            )
+            f.write(text)
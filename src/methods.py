@@ -0,0 +1,41 @@
+# グローバル変数
+# main.pyの--methodで指定出来るアルゴリズム.
+method = ['DA', 'MNK', 'HNG', 'JV', 'MCF', 'SPR', 'AUC', 'RMX']
+
+
+def solve(
+    problem, name, rounds=1, stats=None, chains=False, components=False,
+    jobs=1
+):
+    '''
+    アルゴリズムnameで配属を計算する関数.
+    各アルゴリズムのモジュールは, 用いる場合だけ読み込む.
+    DAとRMXは標準ライブラリだけで計算するため, numpy等を読み込まない.
+    rounds, stats, chainsはDAの場合だけ用いる (da.pyのDA関数を参照).
+    components=Trueの場合, 連結成分ごとにjobs個のプロセスで計算する
+    (components.pyのsolve_components関数を参照).
+    '''
+    if components:
+        from components import solve_components
+        return solve_components(
+            problem, name, jobs=jobs, rounds=rounds, stats=stats,
+            chains=chains
+        )
+    if name == method[0]:
+        from da import DA
+        return DA(problem, rounds=rounds, stats=stats, chains=chains)
+    if name == method[1]:
+        from calc_assignment_tools import MNK as solver
+    elif name == method[2]:
+        from calc_assignment_tools import HNG as solver
+    elif name == method[3]:
+        from calc_assignment_tools import JV as solver
+    elif name == method[4]:
+        from calc_assignment_tools import MCF as solver
+    elif name == method[5]:
+        from calc_assignment_tools import SPR as solver
+    elif name == method[6]:
+        from calc_assignment_tools import AUC as solver
+    else:
+        from rank_maximal import RMX as solver
+    return solver(problem)
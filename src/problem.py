@@ -0,0 +1,259 @@
+from array import array
+from bisect import bisect_left
+
+
+class Problem:
+    '''
+    研究室配属問題を整数に符号化して保持するクラス.
+    学生と教員は名前の表students, teachersの番号で表す.
+    志望順位 (choice) と選好順位 (preference) はCSR形式のint32配列
+    (arrayか, instance.pyで読み込んだ場合はメモリマップしたmemoryview) で持ち,
+    学生iの志望はchoice_teacher[choice_ptr[i]:choice_ptr[i+1]]に志望順位の昇順で,
+    教員jの選好はpref_student[pref_ptr[j]:pref_ptr[j+1]]に学生番号の昇順で並ぶ.
+    ranksはsubproblem関数で作った場合の元のProblemのrank_limits関数の値で,
+    それ以外はNoneである.
+    '''
+    __slots__ = (
+        'students',
+        'teachers',
+        'capacity',
+        'choice_ptr',
+        'choice_teacher',
+        'choice_rank',
+        'pref_ptr',
+        'pref_student',
+        'pref_rank',
+        'ranks',
+    )
+
+    def __init__(
+        self, students, teachers, capacity,
+        choice_ptr, choice_teacher, choice_rank,
+        pref_ptr, pref_student, pref_rank, ranks=None
+    ):
+        self.students = students
+        self.teachers = teachers
+        self.capacity = capacity
+        self.choice_ptr = choice_ptr
+        self.choice_teacher = choice_teacher
+        self.choice_rank = choice_rank
+        self.pref_ptr = pref_ptr
+        self.pref_student = pref_student
+        self.pref_rank = pref_rank
+        self.ranks = ranks
+
+    @classmethod
+    def from_data(cls, data):
+        '''
+        main.pyの入力形式のdictからProblemを作る関数.
+        '''
+        students = list(data['students'].keys())
+        teachers = list(data['teachers'].keys())
+        sindex = {s: i for i, s in enumerate(students)}
+        tindex = {t: j for j, t in enumerate(teachers)}
+        capacity = array(
+            'i', [data['teachers'][t]['capacity'] for t in teachers]
+        )
+        # 志望は志望順位の昇順に並べる.
+        choice_ptr = array('i', [0])
+        choice_teacher, choice_rank = array('i'), array('i')
+        for s in students:
+            c = data['students'][s]['choice']
+            ts = sorted(c, key=c.get)
+            choice_teacher.extend(map(tindex.__getitem__, ts))
+            choice_rank.extend(map(c.__getitem__, ts))
+            choice_ptr.append(len(choice_teacher))
+        # 選好は学生番号の昇順に並べ, 二分探索で選好順位を引けるようにする.
+        pref_ptr = array('i', [0])
+        pref_student, pref_rank = array('i'), array('i')
+        for t in teachers:
+            p = data['teachers'][t]['preference']
+            ss = sorted(p, key=sindex.__getitem__)
+            pref_student.extend(map(sindex.__getitem__, ss))
+            pref_rank.extend(map(p.__getitem__, ss))
+            pref_ptr.append(len(pref_student))
+        return cls(
+            students, teachers, capacity,
+            choice_ptr, choice_teacher, choice_rank,
+            pref_ptr, pref_student, pref_rank
+        )
+
+    def to_data(self):
+        '''
+        Problemをmain.pyの入力形式のdictに戻す関数.
+        '''
+        data = {'students': {}, 'teachers': {}}
+        for i, s in enumerate(self.students):
+            a, b = self.choice_ptr[i], self.choice_ptr[i+1]
+            data['students'][s] = {
+                'choice': {
+                    self.teachers[j]: int(k)
+                    for j, k in zip(
+                        self.choice_teacher[a:b], self.choice_rank[a:b]
+                    )
+                }
+            }
+        for j, t in enumerate(self.teachers):
+            a, b = self.pref_ptr[j], self.pref_ptr[j+1]
+            data['teachers'][t] = {
+                'capacity': int(self.capacity[j]),
+                'preference': {
+                    self.students[i]: int(k)
+                    for i, k in zip(
+                        self.pref_student[a:b], self.pref_rank[a:b]
+                    )
+                }
+            }
+        return data
+
+    @property
+    def ns(self):
+        '''
+        学生数.
+        '''
+        return len(self.students)
+
+    @property
+    def nt(self):
+        '''
+        教員数.
+        '''
+        return len(self.teachers)
+
+    def with_choice(self, i, choice):
+        '''
+        学生iの志望をchoice ({教員番号: 志望順位}) に置き換えたProblemを返す関数.
+        変更しない配列は元のProblemと共有する.
+        '''
+        ts = sorted(choice, key=choice.get)
+        a, b = self.choice_ptr[i], self.choice_ptr[i+1]
+        d = len(ts)-(b-a)
+        choice_ptr = _copy(self.choice_ptr[:i+1])
+        choice_ptr.extend(p+d for p in self.choice_ptr[i+1:])
+        choice_teacher = _copy(self.choice_teacher[:a])
+        choice_teacher.extend(ts)
+        choice_teacher.extend(_copy(self.choice_teacher[b:]))
+        choice_rank = _copy(self.choice_rank[:a])
+        choice_rank.extend(choice[j] for j in ts)
+        choice_rank.extend(_copy(self.choice_rank[b:]))
+        return Problem(
+            self.students, self.teachers, self.capacity,
+            choice_ptr, choice_teacher, choice_rank,
+            self.pref_ptr, self.pref_student, self.pref_rank, self.ranks
+        )
+
+    def with_capacity(self, j, capacity):
+        '''
+        教員jの定員をcapacityに置き換えたProblemを返す関数.
+        変更しない配列は元のProblemと共有する.
+        '''
+        _capacity = array('i', self.capacity)
+        _capacity[j] = capacity
+        return Problem(
+            self.students, self.teachers, _capacity,
+            self.choice_ptr, self.choice_teacher, self.choice_rank,
+            self.pref_ptr, self.pref_student, self.pref_rank, self.ranks
+        )
+
+    def with_capacities(self, capacity):
+        '''
+        全ての教員の定員をcapacity (教員番号順の列) に置き換えたProblemを返す関数.
+        定員以外の配列は元のProblemと共有する.
+        '''
+        return Problem(
+            self.students, self.teachers, array('i', capacity),
+            self.choice_ptr, self.choice_teacher, self.choice_rank,
+            self.pref_ptr, self.pref_student, self.pref_rank, self.ranks
+        )
+
+    def subproblem(self, students, teachers):
+        '''
+        学生番号の昇順のリストstudentsと教員番号の昇順のリストteachersの
+        学生と教員だけを持つProblemを返す関数.
+        番号は並べた順に振り直し, それ以外の学生と教員への志望と選好は除く.
+        rank_limits関数は元のProblemの値を返すため, calc_assignment_tools.pyの
+        費用は元のProblemと同じになる.
+        '''
+        sindex = {i: k for k, i in enumerate(students)}
+        tindex = {j: k for k, j in enumerate(teachers)}
+        capacity = array('i', [self.capacity[j] for j in teachers])
+        choice_ptr = array('i', [0])
+        choice_teacher, choice_rank = array('i'), array('i')
+        for i in students:
+            for k in range(self.choice_ptr[i], self.choice_ptr[i+1]):
+                j = tindex.get(self.choice_teacher[k])
+                if j is not None:
+                    choice_teacher.append(j)
+                    choice_rank.append(self.choice_rank[k])
+            choice_ptr.append(len(choice_teacher))
+        # 学生番号の昇順を保つため, 選好は並べ直さなくてよい.
+        pref_ptr = array('i', [0])
+        pref_student, pref_rank = array('i'), array('i')
+        for j in teachers:
+            for k in range(self.pref_ptr[j], self.pref_ptr[j+1]):
+                i = sindex.get(self.pref_student[k])
+                if i is not None:
+                    pref_student.append(i)
+                    pref_rank.append(self.pref_rank[k])
+            pref_ptr.append(len(pref_student))
+        return Problem(
+            [self.students[i] for i in students],
+            [self.teachers[j] for j in teachers],
+            capacity,
+            choice_ptr, choice_teacher, choice_rank,
+            pref_ptr, pref_student, pref_rank, self.rank_limits()
+        )
+
+    def rank_limits(self):
+        '''
+        志望順位の最小値と, 選好順位の最小値, 最大値の組を返す関数.
+        順位が1つも無い場合, その値はNoneとする.
+        subproblem関数で作ったProblemでは, 元のProblemの値を返す.
+        '''
+        if self.ranks is not None:
+            return self.ranks
+        return (
+            min(self.choice_rank, default=None),
+            min(self.pref_rank, default=None),
+            max(self.pref_rank, default=None)
+        )
+
+    def choice(self, i, j, default=None):
+        '''
+        学生iによる教員jの志望順位を返す関数.
+        志望していない場合はdefaultを返す.
+        '''
+        for k in range(self.choice_ptr[i], self.choice_ptr[i+1]):
+            if self.choice_teacher[k] == j:
+                return self.choice_rank[k]
+        return default
+
+    def rank(self, j, i, default=None):
+        '''
+        教員jによる学生iの選好順位を返す関数.
+        選好順位が無い場合はdefaultを返す.
+        '''
+        a, b = self.pref_ptr[j], self.pref_ptr[j+1]
+        k = bisect_left(self.pref_student, i, a, b)
+        if k < b and self.pref_student[k] == i:
+            return self.pref_rank[k]
+        return default
+
+
+def _copy(buffer):
+    '''
+    int32の配列 (arrayかmemoryview) を複製したarrayを返す関数.
+    '''
+    a = array('i')
+    a.frombytes(memoryview(buffer).cast('B'))
+    return a
+
+
+def as_problem(data):
+    '''
+    dataがProblemでなければ, main.pyの入力形式のdictとみなして
+    Problemに変換する関数.
+    '''
+    if isinstance(data, Problem):
+        return data
+    return Problem.from_data(data)
@@ -0,0 +1,247 @@
+from instrument import emit, enabled, phase
+from problem import as_problem
+
+# グローバル変数
+# RankMaximalクラスで求める頂点の分類. 偶 (even), 奇 (odd), 到達不能 (unreachable).
+U, E, O = 0, 1, 2
+
+
+def RMX(data):
+    '''
+    rank-maximal matching (Irving et al.) により配属を決定する関数.
+    第1志望に配属される学生数を最大にし, その中で第2志望に配属される学生数を最大にし,
+    ... という順に志望順位ごとの人数を辞書式に最大にする配属を1つだけ導く.
+    志望リストに含まれない教員には配属しないため, 配属が決まらなかった学生は
+    assignment['未配属']に格納される.
+    dataにはmain.pyの入力形式のdictかProblemを指定する.
+    '''
+    problem = as_problem(data)
+    match = RankMaximal(problem).compute()
+    S = problem.students
+    assignment = {t: [] for t in problem.teachers}
+    unassigned = []
+    for i, j in enumerate(match):
+        if j >= 0:
+            assignment[problem.teachers[j]].append(S[i])
+        else:
+            unassigned.append(S[i])
+
+    if len(unassigned) != 0:
+        assignment['未配属'] = unassigned
+    return assignment
+
+
+class RankMaximal:
+    '''
+    rank-maximal matchingを計算するクラス.
+    志望順位の小さい順に志望の辺を加えながら最大マッチングを広げる.
+    各志望順位で最大マッチングを求めた後, 頂点を偶, 奇, 到達不能に分類し,
+    奇か到達不能の頂点のより大きい志望順位の辺と, 奇-奇, 奇-到達不能の辺を除く.
+    除いた辺はそれまでの志望順位の人数を減らさずには使えないため, 以降の志望順位の
+    マッチングは前の志望順位の人数を保つ.
+    教員は定員枠に展開せず, 定員までの学生を受け入れる頂点として扱うため,
+    計算量は志望の総数と志望順位の数の積に比例する (増加路の探索を除く).
+    '''
+
+    def __init__(self, problem):
+        self.problem = problem
+        ns, nt = problem.ns, problem.nt
+        self.capacity = problem.capacity
+        # adj[s]は現在のグラフで学生sが辺を持つ教員のリスト.
+        self.adj = [[] for _ in range(ns)]
+        # match[s]は学生sの配属先の教員番号 (未配属の場合は-1).
+        # members[t]は教員tに配属された学生 (dictをキーの順序付きの集合として用いる).
+        self.match = [-1]*ns
+        self.members = [{} for _ in range(nt)]
+        self.load = [0]*nt
+
+    def compute(self):
+        '''
+        rank-maximal matchingを計算し, 各学生の配属先の教員番号のリストを返す関数.
+        '''
+        problem = self.problem
+        ns, nt = problem.ns, problem.nt
+        ptr, teacher, level = (
+            problem.choice_ptr, problem.choice_teacher, problem.choice_rank
+        )
+        adj = self.adj
+        # nxt[s]はまだ加えていない学生sの志望の位置である.
+        nxt = list(ptr[:-1])
+        closed_s, closed_t = [False]*ns, [False]*nt
+        with phase('RankMaximal.compute'):
+            for i in sorted(set(level)):
+                # 志望順位iの辺を加える.
+                for s in range(ns):
+                    k, b = nxt[s], ptr[s+1]
+                    while k < b and level[k] == i:
+                        if not closed_s[s] and not closed_t[teacher[k]]:
+                            adj[s].append(teacher[k])
+                        k += 1
+                    nxt[s] = k
+                augmented = self.augment()
+                if enabled():
+                    emit(
+                        'rank_maximal', rank=i, augmented=augmented,
+                        matched=sum(self.load)
+                    )
+                se, te = self.decompose()
+                # 奇か到達不能の頂点は, より大きい志望順位の辺を持たない.
+                for s in range(ns):
+                    if se[s] != E:
+                        closed_s[s] = True
+                for t in range(nt):
+                    if te[t] != E:
+                        closed_t[t] = True
+                # 奇-奇と奇-到達不能の辺を除く. 除く辺はマッチングに含まれない.
+                for s in range(ns):
+                    if se[s] == O:
+                        adj[s] = [t for t in adj[s] if te[t] == E]
+                    elif se[s] == U:
+                        adj[s] = [t for t in adj[s] if te[t] != O]
+        return list(self.match)
+
+    def augment(self):
+        '''
+        現在のグラフのマッチングを, 増加路が無くなるまで広げる関数 (Hopcroft-Karp型).
+        未配属の学生から幅優先探索で層を求め, 層に沿った深さ優先探索で
+        学生を共有しない増加路をまとめて見つけることを繰り返す.
+        広げた回数を返す.
+        '''
+        adj, match, members = self.adj, self.match, self.members
+        load, capacity = self.load, self.capacity
+        ns, nt = len(adj), len(capacity)
+        augmented = 0
+        while True:
+            # dist[s]は未配属の学生からの学生sの層の番号で, -1は未到達か探索済みを表す.
+            # tdist[t]は教員tに最初に到達した学生の層の番号である.
+            dist, tdist = [-1]*ns, [-1]*nt
+            roots = [s for s in range(ns) if match[s] == -1 and adj[s]]
+            for s in roots:
+                dist[s] = 0
+            queue, found, k = list(roots), False, 0
+            while k < len(queue):
+                s = queue[k]
+                k += 1
+                for t in adj[s]:
+                    if t == match[s]:
+                        continue
+                    if load[t] < capacity[t]:
+                        found = True
+                    elif not found and tdist[t] == -1:
+                        tdist[t] = dist[s]
+                        for r in members[t]:
+                            if dist[r] == -1:
+                                dist[r] = dist[s]+1
+                                queue.append(r)
+            if not found:
+                return augmented
+            self._dist, self._tdist = dist, tdist
+            # _rest[t]は深さ優先探索でまだ辿っていない教員tの配属者のリスト.
+            self._rest = [None]*nt
+            count = sum(1 for s in roots if self._find_path(s))
+            if count == 0:
+                return augmented
+            augmented += count
+
+    def _moves(self, s):
+        '''
+        学生sから層に沿って進める (教員, 学生) の組を生成するジェネレータ.
+        定員に空きのある教員に進める場合は, 学生を-1とする.
+        教員の配属者は, この層の探索で1度だけ辿る.
+        '''
+        match, load, capacity = self.match, self.load, self.capacity
+        dist, tdist, rest = self._dist, self._tdist, self._rest
+        for t in self.adj[s]:
+            if t == match[s]:
+                continue
+            if load[t] < capacity[t]:
+                yield t, -1
+            elif tdist[t] == dist[s]:
+                if rest[t] is None:
+                    rest[t] = list(self.members[t])
+                while len(rest[t]) != 0:
+                    r = rest[t].pop()
+                    if dist[r] == dist[s]+1:
+                        yield t, r
+
+    def _find_path(self, root):
+        '''
+        学生rootから層に沿って増加路を深さ優先探索し, 見つかればマッチングを
+        更新してTrueを返す関数. 通った学生はこの層では再び用いない.
+        '''
+        match, members, load, dist = (
+            self.match, self.members, self.load, self._dist
+        )
+        stack, via = [(root, self._moves(root))], []
+        while len(stack) != 0:
+            s, it = stack[-1]
+            for t, r in it:
+                via.append(t)
+                if r == -1:
+                    # 増加路に沿って, 各学生を1つ先の教員に移す.
+                    for (s, _), t in zip(stack, via):
+                        if match[s] != -1:
+                            del members[match[s]][s]
+                            load[match[s]] -= 1
+                        match[s] = t
+                        members[t][s] = None
+                        load[t] += 1
+                        dist[s] = -1
+                    return True
+                stack.append((r, self._moves(r)))
+                break
+            else:
+                dist[s] = -1
+                stack.pop()
+                if len(via) != 0:
+                    via.pop()
+        return False
+
+    def decompose(self):
+        '''
+        最大マッチングについて, 学生と教員を偶 (E), 奇 (O), 到達不能 (U) に分類する関数
+        (Gallai-Edmonds分解). 未配属の学生か定員に空きのある教員から, 偶数本の
+        交互路で到達出来る頂点を偶, 奇数本で到達出来る頂点を奇とする.
+        定員の枠は互いに区別しないため, 同じ教員の枠は全て同じ分類になる.
+        学生と教員の分類のリストを返す.
+        '''
+        adj, match, members = self.adj, self.match, self.members
+        ns, nt = len(adj), len(self.capacity)
+        se, te = [U]*ns, [U]*nt
+        # 未配属の学生から, 辺で教員 (奇) に, 配属の辺で学生 (偶) に進む.
+        queue = [s for s in range(ns) if match[s] == -1]
+        for s in queue:
+            se[s] = E
+        k = 0
+        while k < len(queue):
+            s = queue[k]
+            k += 1
+            for t in adj[s]:
+                if te[t] != U:
+                    continue
+                te[t] = O
+                for r in members[t]:
+                    if se[r] == U:
+                        se[r] = E
+                        queue.append(r)
+        # 定員に空きのある教員から, 辺で学生 (奇) に, 配属の辺で教員 (偶) に進む.
+        radj = [[] for _ in range(nt)]
+        for s in range(ns):
+            for t in adj[s]:
+                radj[t].append(s)
+        queue = [t for t in range(nt) if self.load[t] < self.capacity[t]]
+        for t in queue:
+            te[t] = E
+        k = 0
+        while k < len(queue):
+            t = queue[k]
+            k += 1
+            for s in radj[t]:
+                if se[s] != U:
+                    continue
+                se[s] = O
+                r = match[s]
+                if r != -1 and te[r] == U:
+                    te[r] = E
+                    queue.append(r)
+        return se, te
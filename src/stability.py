@@ -0,0 +1,59 @@
+from bisect import bisect_right
+from problem import as_problem
+
+
+def check_stability(assignment, data):
+    '''
+    配属assignmentのブロッキングペアと, 学生ごとの正当な羨望の数を求める関数.
+    dataにはmain.pyの入力形式のdictかProblemを指定する.
+    学生sが配属先より志望順位の高い教員tについて, tの定員に空きがあるか,
+    tが仮配属者の誰かよりsを高く選好する場合, (s, t)をブロッキングペアとする.
+    正当な羨望の数は, sが配属先より高く志望する教員に配属された学生のうち,
+    その教員がsより低く選好する学生の数である.
+    選好順位の無い学生は, 選好順位の有る全ての学生より低く選好されるとみなす.
+    ブロッキングペア (学生名, 教員名) のリストと, 学生名をキーとする羨望の数のdictを返す.
+    配属先より高く志望する教員だけを調べるため, 計算量は志望の総数に対して線形
+    (選好順位の二分探索の分だけ対数倍) である.
+    '''
+    problem = as_problem(data)
+    S, T = problem.students, problem.teachers
+    ptr, teacher, level = (
+        problem.choice_ptr, problem.choice_teacher, problem.choice_rank
+    )
+    capacity = problem.capacity
+    sindex = {s: i for i, s in enumerate(S)}
+    inf = float('inf')
+    # match[i]は学生iの配属先の教員番号 (未配属の場合は-1).
+    # held[j]は教員jに配属された学生の選好順位の昇順のリスト.
+    match = [-1]*problem.ns
+    held = []
+    for j, t in enumerate(T):
+        ranks = []
+        for s in assignment.get(t, []):
+            i = sindex[s]
+            match[i] = j
+            ranks.append(problem.rank(j, i, inf))
+        ranks.sort()
+        held.append(ranks)
+    pairs, envy = [], {}
+    for i, s in enumerate(S):
+        a, b = ptr[i], ptr[i+1]
+        # 配属先の志望順位. 未配属か, 志望していない教員に配属された場合は無限大とする.
+        current = inf
+        for k in range(a, b):
+            if teacher[k] == match[i]:
+                current = level[k]
+                break
+        count = 0
+        # 志望は志望順位の昇順に並ぶため, 配属先に達したら打ち切る.
+        for k in range(a, b):
+            if level[k] >= current:
+                break
+            j = teacher[k]
+            ranks = held[j]
+            lower = len(ranks)-bisect_right(ranks, problem.rank(j, i, inf))
+            count += lower
+            if len(ranks) < capacity[j] or lower != 0:
+                pairs.append((s, T[j]))
+        envy[s] = count
+    return pairs, envy